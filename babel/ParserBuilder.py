@@ -1,4 +1,6 @@
 import weakref
+import re
+from babel.terminal import first_chars
 
 # Builder class that drives parser compilation
 # Recursively traverses grammar tree and fetches compile methods from compiler
@@ -47,3 +49,67 @@ class Recursion:
   
   def __call__( self, state ):
     return self.target( state )
+
+# Compile-time analysis of the characters that can start the input matched by a rule
+# Terminals declare the patterns that can start their input in 'first'
+# Calling the analysis returns ( set of characters, can the rule match empty input )
+# The set is None if it cannot be determined, for terminals that declare no 'first'
+# and for rules that are still being analysed (recursion)
+
+class First:
+  def __init__( self, terminals ):
+    self._terminals = terminals
+    self._visited   = {}
+
+  def __call__( self, target ):
+    if target in self._visited:
+      result = self._visited[target]
+      return ( None, True ) if result is None else result
+    self._visited[target] = None  # recursion guard
+    name = type(target).__name__
+    result = getattr( self, name )( target )
+    self._visited[target] = result
+    return result
+
+    # the first characters as a list of patterns, None if any character can start the input
+  def patterns( self, target ):
+    chars, nullable = self( target )
+    if chars is None or nullable:
+      return None
+    return ( re.compile( '[' + ''.join( re.escape(char) for char in sorted(chars) ) + ']' ), )
+
+  def Terminal( self, target ):
+    patterns = getattr( self._terminals.get( target.name ), 'first', None )
+    if patterns is None:
+      return None, True
+    return self.union( [ first_chars( pattern ) for pattern in patterns ] )
+
+  def Handle( self, target ):
+    return self( target.rule )
+
+  Push = Handle
+
+  def Optional( self, target ):
+    return self( target.rule )[0], True
+
+  Repeat = Optional
+
+  def Not( self, target ):
+    return None, True
+
+  def Alternative( self, target ):
+    return self.union( [ self( rule ) for rule in target ] )
+
+  def Sequence( self, target ):
+    firsts = []
+    for rule in target:
+      firsts.append( self( rule ) )
+      if not firsts[-1][1]:
+        break
+    chars, nullable = self.union( firsts )
+    return chars, all( empty for first, empty in firsts )
+
+  def union( self, firsts ):
+    if any( chars is None for chars, nullable in firsts ):
+      return None, True
+    return set().union( *( chars for chars, nullable in firsts ) ), any( nullable for chars, nullable in firsts )
@@ -24,13 +24,17 @@ class ReprVisitor:
   def get_repr( self, rule ):
     if rule is None:
       return 'None'
-    s = self.getname(rule)
+    s = self.label(rule)
       # also works for terminals
       # zip of lists with different lengths terminates at len(shorter list)
     lst = ([False] * (len(rule)-1)) + [True] # (at least one element)
     s += ''.join( ( self.visit(child, last ) for (child, last) in zip( rule, lst ) ) )
     return s
     
+    # text of a rule at its first visit, subclasses can extend it
+  def label( self, rule ):
+    return self.getname(rule)
+
   def getname( self, rule ):
     try:
       name = type(rule).__name__ + ' (' + rule.name + ')'
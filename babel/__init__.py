@@ -12,7 +12,17 @@ from babel.terminal   import Wrapper
 from babel.terminal   import Switch
 from babel.terminal   import Return
 from babel.terminal   import ParserFailedException
+from babel.terminal   import FAIL
 
 from babel.state      import State
+from babel.state      import Cursor
+from babel.state      import Journal
+from babel.state      import Recorder
 
-from babel.lang.parser import parseStr
\ No newline at end of file
+  # babel.lang.parser compiles the meta-grammar on import, it is loaded on first use
+  # so that grammars read from babel.cache do not pay for it
+def __getattr__( name ):
+  if name == 'parseStr':
+    from babel.lang.parser import parseStr
+    return parseStr
+  raise AttributeError( "module 'babel' has no attribute '" + name + "'" )
@@ -0,0 +1,53 @@
+import hashlib
+import os
+import pickle
+
+__all__ = [ 'load', 'VERSION' ]
+
+  # Version of the cache format, part of the cache key
+  # Bump it when the rule classes or the grammar of babel.lang change
+VERSION = 1
+
+  # Cache directory, created next to the grammar file
+directory = '__babelcache__'
+
+  # Loads the rules of the grammar file 'path' as parsed by babel.lang.parser.parseStr
+  # Returns the symtable of the grammar ( rule name -> rule )
+  # The rule graph is pickled to __babelcache__/<file>.<hash>.pickle next to the grammar,
+  # <file>.plain.<hash>.pickle without 'optimize'.
+  # The hash covers the file, VERSION and 'version' - the version of the terminal table
+  # the grammar is written for. A changed hash, or an unreadable cache, rebuilds the rules.
+  # babel.lang.parser is imported for rebuilds only, it compiles the meta-grammar on import
+  # With 'optimize' the rules are rewritten by babel.optimizer before they are cached
+def load( path, version = '', optimize = True ):
+  with open( path, 'rb' ) as file:
+    text = file.read()
+  key = hashlib.sha1( repr( ( VERSION, version, optimize ) ).encode('utf-8') + text ).hexdigest()[:16]
+  folder = os.path.join( os.path.dirname( path ), directory )
+  name = os.path.basename( path ) + ( '' if optimize else '.plain' )
+  cached = os.path.join( folder, name + '.' + key + '.pickle' )
+  try:
+    with open( cached, 'rb' ) as file:
+      return pickle.load( file )
+  except ( OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError ):
+    pass
+
+  import babel.lang.parser as p
+  symtable = p.parseStr( text.decode('utf-8') ).symtable
+  if optimize:
+    import babel.optimizer as optimizer
+    symtable = optimizer.optimize( symtable )
+  try:
+    os.makedirs( folder, exist_ok = True )
+    temporary = cached + '.%d.tmp' % os.getpid()
+    with open( temporary, 'wb' ) as file:
+      pickle.dump( symtable, file, pickle.HIGHEST_PROTOCOL )
+    os.replace( temporary, cached )
+      # drop caches of older versions of the file
+    for entry in os.listdir( folder ):
+      if entry.startswith( name + '.' ) and entry.endswith( '.pickle' ) and entry != os.path.basename( cached ) \
+         and '.' not in entry[len(name) + 1:-len('.pickle')]:
+        os.remove( os.path.join( folder, entry ) )
+  except OSError:
+    pass  # read-only installation, parse on every import
+  return symtable
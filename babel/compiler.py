@@ -1,4 +1,11 @@
+import time
+
 from babel.terminal import ParserFailedException
+from babel.terminal import FAIL
+from babel.terminal import attempting
+from babel.ParserBuilder import First
+from babel.ReprVisitor import ReprVisitor
+from babel.rule import Terminal
 
 class RuleCompilerBase:
   __slots__ = '_terminals'
@@ -6,6 +13,16 @@ class RuleCompilerBase:
     self._terminals = terminals
     super().__init__()
 
+    # Called once with the root rule, before ParserBuilder compiles it
+    # Allows the compiler to analyse the whole grammar first
+  def prepare( self, rule ):
+    pass
+
+    # Called once with the root parser returned by ParserBuilder
+    # Allows the compiler to wrap the entry point of the grammar
+  def entry( self, parser ):
+    return parser
+
   def Terminal( self, target, children ):
     try:
       return self._terminals[target.name]
@@ -93,4 +110,531 @@ class Reordering( RuleCompilerBase ):
     def _Push( state ):
       t = [ f(state) for f in children[0]( state ) ]
       return ()
-    return _Push
\ No newline at end of file
+    return _Push
+
+  # Packrat variant of Reordering
+  # A compiled rule that can be tried twice at the same input position caches its outcome
+  # per (rule, input position), so it is not parsed again after backtracking.
+  # Those are the rules that start two branches of an Alternative, or that a child of a
+  # Sequence tries where it ends and a later child starts with - 'x *x ?x' tries x after
+  # the last repetition fails. prepare finds them with ParserBuilder.First,
+  # the other rules compile as in Reordering, without a memo lookup.
+  # Failures are always cached - they depend only on the input.
+  # Successes are cached only for pure parsers, that consume input and return
+  # deferred functions without executing them. Sequence and Push execute
+  # functions on the state, so only their failures are cached.
+  # The memo table is bounded by 'size' and cleared on every call of the entry point (per line)
+  # It is not an optimization for grammars that rarely backtrack: heidenhain.lang re-enters
+  # only coordCartesian and 'XYZABC', saving 0.13 of 15.75 terminal calls per line, and parses
+  # as fast as Reordering ( see languages.heidenhain.parser.bench_compilers ).
+  # No build uses it by default.
+class Memoizing( Reordering ):
+  def __init__( self, terminals, size = 4096 ):
+    self._memo      = {}  # (rule key, position) -> (result, consumed length) or None for failure
+    self._size      = size
+    self._keys      = 0   # number of memoized parsers
+    self._pure      = {}  # parser -> can its successes be memoized
+    self._compiled  = {}  # terminal name -> compiled terminal
+    self._reentered = None  # rules and terminal names that can be re-entered, all before prepare
+    super().__init__( terminals )
+
+  def prepare( self, rule ):
+    first = First( self._terminals )
+    leading, trailing = {}, {}
+      # the rule, and the rules and terminal names tried at its start position
+    def lead( target ):
+      if target in leading:
+        return leading[target] or set()  # recursion: a left-recursive rule cannot be parsed anyway
+      leading[target] = None
+      result = { target.name if isinstance( target, Terminal ) else target }
+      for child in target:
+        result |= lead( child )
+        if type(target).__name__ == 'Sequence' and not first( child )[1]:
+          break
+      leading[target] = result
+      return result
+      # the rules and terminal names tried, and failed, at the position where the rule ends
+      # ( the last try of a Repeat, an Optional that did not match )
+    def trail( target ):
+      if target in trailing:
+        return trailing[target] or set()
+      trailing[target] = None
+      kind, result = type(target).__name__, set()
+      children = list( target )
+      for child in ( reversed( children ) if kind == 'Sequence' else children ):
+        if kind in ( 'Optional', 'Repeat', 'Not' ):
+          result |= lead( child )
+        if kind != 'Not':
+          result |= trail( child )
+        if kind == 'Sequence' and not first( child )[1]:
+          break
+      trailing[target] = result
+      return result
+    reentered, seen, stack = set(), set(), [ rule ]
+    while len(stack) > 0:
+      target = stack.pop()
+      if target in seen:
+        continue
+      seen.add( target )
+      stack.extend( target )
+      children = list( target )
+      kind = type(target).__name__
+      for index, child in enumerate( children ):
+        if kind == 'Alternative':
+          for other in children[index+1:]:
+            reentered |= lead( child ) & lead( other )
+        elif kind == 'Sequence':
+            # the next children start where 'child' ends, up to the first one that consumes input
+          tried = trail( child ) | ( lead( child ) if first( child )[1] else set() )
+          for other in children[index+1:]:
+            reentered |= tried & lead( other )
+            if not first( other )[1]:
+              break
+    self._reentered = reentered
+
+  def memoized( self, key ):
+    return self._reentered is None or key in self._reentered
+
+  def entry( self, parser ):
+    memo = self._memo
+    def _Entry( state ):
+      memo.clear()
+      return parser( state )
+    return _Entry
+
+    # 'parser' with a memo, if the rule or terminal name 'key' can be re-entered
+  def memoize( self, parser, pure, key ):
+    if not self.memoized( key ):
+      self._pure[parser] = pure
+      return parser
+    memo, size = self._memo, self._size
+    key = self._keys
+    self._keys += 1
+    def _Memo( state ):
+      remaining = state.remaining
+      position = ( key, remaining )
+      try:
+        entry = memo[position]
+      except KeyError:
+        pass
+      else:
+        if entry is None:
+          raise ParserFailedException('Memoized failure')
+        result, consumed = entry
+        state.advance( state.pos + consumed )
+        return result
+
+      if len(memo) >= size:
+        memo.clear()
+      try:
+        result = parser( state )
+      except ParserFailedException:
+        memo[position] = None
+        raise
+      if pure:
+        memo[position] = ( result, remaining - state.remaining )
+      return result
+
+    self._pure[_Memo] = pure
+    return _Memo
+
+  def is_pure( self, parsers ):
+    return all( self._pure.get( parser, False ) for parser in parsers )
+
+  def Terminal( self, target, children ):
+    try:
+      return self._compiled[target.name]
+    except KeyError:
+      terminal = super().Terminal( target, children )
+      parser = self.memoize( terminal, getattr( terminal, 'pure', False ), target.name )
+      self._compiled[target.name] = parser
+      return parser
+
+  def Not( self, target, children ):
+    return self.memoize( super().Not( target, children ), self.is_pure( children ), target )
+
+  def Optional( self, target, children ):
+    return self.memoize( super().Optional( target, children ), self.is_pure( children ), target )
+
+  def Alternative( self, target, children ):
+    return self.memoize( super().Alternative( target, children ), self.is_pure( children ), target )
+
+  def Repeat( self, target, children ):
+    return self.memoize( super().Repeat( target, children ), self.is_pure( children ), target )
+
+  def Sequence( self, target, children ):
+    return self.memoize( super().Sequence( target, children ), False, target )
+
+  def Push( self, target, children ):
+    return self.memoize( super().Push( target, children ), False, target )
+
+
+  # Reordering variant that dispatches on the next input character
+  # ParserBuilder's First analysis gives the characters that can start each rule.
+  # Alternative only tries the branches that can start with the next character,
+  # Optional and Repeat stop without trying their rule when it cannot start there.
+  # Compiled parsers declare their first characters in 'first', like terminals,
+  # so a grammar compiled with Lookahead can serve as a terminal of another one
+class Lookahead( Reordering ):
+  def __init__( self, terminals ):
+    super().__init__( terminals )
+    self._first = First( terminals )
+
+  def annotate( self, parser, target ):
+    parser.first = self._first.patterns( target )
+    return parser
+
+    # next character -> branches of the alternative that can start with it, in order,
+    # and the branches tried for any other character
+  def branches( self, target, children ):
+    firsts = [ self._first( rule ) for rule in target ]
+    anywhere = [ chars is None or nullable for chars, nullable in firsts ]
+    known = set().union( *( chars for (chars, nullable), any_ in zip( firsts, anywhere ) if not any_ ) )
+    table = { char : tuple( child for child, (chars, nullable), any_ in zip( children, firsts, anywhere ) 
+                              if any_ or char in chars ) 
+                for char in known }
+    default = tuple( child for child, any_ in zip( children, anywhere ) if any_ )
+    return table, default
+
+    # characters that can start the rule, None if it can start with any or match empty input
+  def starts( self, rule ):
+    chars, nullable = self._first( rule )
+    return None if chars is None or nullable else chars
+
+  def Alternative( self, target, children ):
+    table, default = self.branches( target, children )
+    def _Alternative( state ):
+      pos = state.pos
+      for rule in table.get( state.buffer[pos:pos+1] if pos < state.end else '', default ):
+        save = state.save() # entry state
+        try:
+          return rule( state )  # try visiting
+        except ParserFailedException:
+          state.load(save)
+
+      raise ParserFailedException('Parser alternative exhausted with no match') # all options exhausted with no match
+    return self.annotate( _Alternative, target )
+
+  def Optional( self, target, children ):
+    chars = self.starts( target.rule )
+    if chars is None:
+      return self.annotate( super().Optional( target, children ), target )
+    def _Optional( state ):
+      pos = state.pos
+      if ( state.buffer[pos:pos+1] if pos < state.end else '' ) not in chars:
+        return ()
+      save = state.save()
+      try:
+        return children[0]( state )
+      except ParserFailedException:
+        state.load( save )
+        return ()
+    return self.annotate( _Optional, target )
+
+  def Repeat( self, target, children ):
+    chars = self.starts( target.rule )
+    if chars is None:
+      return self.annotate( super().Repeat( target, children ), target )
+    def _Repeat( state ):
+      sequence = []
+      save = None
+      try:
+        while True:
+          pos = state.pos
+          if ( state.buffer[pos:pos+1] if pos < state.end else '' ) not in chars:
+            return tuple( sequence )
+          save = state.save() #save state from before visitation
+          sequence.extend( children[0]( state ) )
+      except ParserFailedException:
+        state.load( save )  # repeat until failure. Discard failed state
+        return tuple( sequence )
+    return self.annotate( _Repeat, target )
+
+  def Not( self, target, children ):
+    return self.annotate( super().Not( target, children ), target )
+
+  def Sequence( self, target, children ):
+    return self.annotate( super().Sequence( target, children ), target )
+
+  def Push( self, target, children ):
+    return self.annotate( super().Push( target, children ), target )
+
+
+  # Lookahead variant that signals failure with the FAIL sentinel instead of exceptions
+  # Compiled rules return FAIL when they do not match, so backtracking in Alternative,
+  # Optional, Repeat and Not is a comparison instead of raising and unwinding an exception.
+  # Terminals are called through their 'attempt' method, terminals in the raising style
+  # are adapted with terminal.attempting. Deferred functions executed by Sequence and Push
+  # may still raise ParserFailedException, it is turned into FAIL.
+  # The entry point raises ParserFailedException as usual, its non-raising version is
+  # available as 'attempt', which the adapter picks when the grammar is used as a terminal
+class Sentinel( Lookahead ):
+  def entry( self, parser ):
+    def _Entry( state ):
+      result = parser( state )
+      if result is FAIL:
+        raise ParserFailedException('Parser failed')
+      return result
+    _Entry.attempt = parser
+      # a grammar of a single terminal compiles to the terminal's bound 'attempt'
+    _Entry.first = getattr( getattr( parser, '__self__', parser ), 'first', None )
+    return _Entry
+
+  def Terminal( self, target, children ):
+    return attempting( super().Terminal( target, children ) )
+
+  def Not( self, target, children ):
+    child = children[0]
+    def _Not( state ):
+      if child( state ) is FAIL:
+        return ()
+      return FAIL
+    return self.annotate( _Not, target )
+
+  def Optional( self, target, children ):
+    child, chars = children[0], self.starts( target.rule )
+    def _Optional( state ):
+      if chars is not None:
+        pos = state.pos
+        if ( state.buffer[pos:pos+1] if pos < state.end else '' ) not in chars:
+          return ()
+      save = state.save()
+      result = child( state )
+      if result is FAIL:
+        state.load( save )
+        return ()
+      return result
+    return self.annotate( _Optional, target )
+
+  def Alternative( self, target, children ):
+    table, default = self.branches( target, children )
+    def _Alternative( state ):
+      pos = state.pos
+      for rule in table.get( state.buffer[pos:pos+1] if pos < state.end else '', default ):
+        save = state.save() # entry state
+        result = rule( state )
+        if result is not FAIL:
+          return result
+        state.load( save )
+      return FAIL
+    return self.annotate( _Alternative, target )
+
+  def Repeat( self, target, children ):
+    child, chars = children[0], self.starts( target.rule )
+    def _Repeat( state ):
+      sequence = []
+      while True:
+        if chars is not None:
+          pos = state.pos
+          if ( state.buffer[pos:pos+1] if pos < state.end else '' ) not in chars:
+            return tuple( sequence )
+        save = state.save() #save state from before visitation
+        result = child( state )
+        if result is FAIL:
+          state.load( save )  # repeat until failure. Discard failed state
+          return tuple( sequence )
+        sequence.extend( result )
+    return self.annotate( _Repeat, target )
+
+  def Sequence( self, target, children ):
+    def _Sequence( state ):
+      sequence = []
+      for rule in children:
+        result = rule( state )
+        if result is FAIL:
+          return FAIL
+        sequence.extend( result )
+      try:
+        for f in sequence:
+          f( state )
+      except ParserFailedException:
+        return FAIL
+      return ()
+    return self.annotate( _Sequence, target )
+
+  def Push( self, target, children ):
+    child = children[0]
+    def _Push( state ):
+      result = child( state )
+      if result is FAIL:
+        return FAIL
+      try:
+        for f in result:
+          f( state )
+      except ParserFailedException:
+        return FAIL
+      return ()
+    return self.annotate( _Push, target )
+
+  # Sentinel variant that records deferred functions instead of executing them
+  # Sequence and Push append the functions to state.effects (see state.Recorder),
+  # grammars used as terminals have to be compiled with Recording as well.
+  # Parsing does not depend on the stack or the symtable then, so lines can be
+  # parsed independently and their effects executed later, in order
+class Recording( Sentinel ):
+  def Sequence( self, target, children ):
+    def _Sequence( state ):
+      sequence = []
+      for rule in children:
+        result = rule( state )
+        if result is FAIL:
+          return FAIL
+        sequence.extend( result )
+      state.effects.extend( sequence )
+      return ()
+    return self.annotate( _Sequence, target )
+
+  def Push( self, target, children ):
+    child = children[0]
+    def _Push( state ):
+      result = child( state )
+      if result is FAIL:
+        return FAIL
+      state.effects.extend( result )
+      return ()
+    return self.annotate( _Push, target )
+
+
+  # Counters of one profiled rule, times are in seconds
+  # 'time' includes the rules called by the rule, 'own' does not
+class RuleStats:
+  __slots__ = 'calls', 'successes', 'failures', 'backtracks', 'time', 'own'
+  def __init__( self ):
+    self.calls      = 0
+    self.successes  = 0
+    self.failures   = 0
+    self.backtracks = 0   # state.load calls made by the rule
+    self.time       = 0.0
+    self.own        = 0.0
+
+  def __repr__( self ):
+    return 'calls %d ok %d failed %d backtracks %d time %.2fms own %.2fms' % ( 
+      self.calls, self.successes, self.failures, self.backtracks, self.time * 1e3, self.own * 1e3 )
+
+  # Reordering variant that measures every compiled rule and terminal
+  # 'stats' maps each rule of the grammar to its RuleStats, terminals are counted
+  # once per name. Time of recursive rules is counted at every level of recursion, and
+  # the 'own' time of a terminal includes the grammar it was compiled from, if any.
+  # The instrumentation is only compiled into parsers built with Profiler,
+  # the other compilers are not affected.
+class Profiler( Reordering ):
+  def __init__( self, terminals ):
+    self.stats     = {}         # rule -> RuleStats
+    self._stack    = [ 0.0 ]    # time spent in the rules called by each active rule
+    self._compiled = {}         # terminal name -> profiled terminal
+    self._terminal = {}         # terminal name -> RuleStats
+    super().__init__( terminals )
+
+  def reset( self ):
+    for stats in self.stats.values():
+      stats.__init__()
+
+    # 'key' is the rule, or the RuleStats to update
+  def profile( self, parser, key ):
+    stats = key if isinstance( key, RuleStats ) else self.stats.setdefault( key, RuleStats() )
+    stack = self._stack
+    clock = time.perf_counter
+    def _Profiled( state ):
+      stats.calls += 1
+      stack.append( 0.0 )
+      start = clock()
+      try:
+        result = parser( state )
+      except ParserFailedException:
+        stats.failures += 1
+        raise
+      finally:
+        elapsed = clock() - start
+        stats.time += elapsed
+        stats.own += elapsed - stack.pop()
+        stack[-1] += elapsed
+      stats.successes += 1
+      return result
+    return _Profiled
+
+  def Terminal( self, target, children ):
+    try:
+      parser = self._compiled[target.name]
+    except KeyError:
+      stats = self._terminal[target.name] = RuleStats()
+      parser = self._compiled[target.name] = self.profile( super().Terminal( target, children ), stats )
+    self.stats[target] = self._terminal[target.name]
+    return parser
+
+  def Handle( self, target, children ):
+    return self.profile( super().Handle( target, children ), target )
+
+  def Not( self, target, children ):
+    return self.profile( super().Not( target, children ), target )
+
+  def Optional( self, target, children ):
+    stats = self.stats[target] = RuleStats()
+    child = children[0]
+    def _Optional( state ):
+      save = state.save()
+      try:
+        return child( state )
+      except ParserFailedException:
+        stats.backtracks += 1
+        state.load( save )
+        return ()
+    return self.profile( _Optional, target )
+
+  def Alternative( self, target, children ):
+    stats = self.stats[target] = RuleStats()
+    def _Alternative( state ):
+      for rule in children:
+        save = state.save()
+        try:
+          return rule( state )
+        except ParserFailedException:
+          stats.backtracks += 1
+          state.load( save )
+      raise ParserFailedException('Parser alternative exhausted with no match')
+    return self.profile( _Alternative, target )
+
+  def Repeat( self, target, children ):
+    stats = self.stats[target] = RuleStats()
+    child = children[0]
+    def _Repeat( state ):
+      sequence = []
+      save = None
+      try:
+        while True:
+          save = state.save()
+          sequence.extend( child( state ) )
+      except ParserFailedException:
+        stats.backtracks += 1
+        state.load( save )
+        return tuple( sequence )
+    return self.profile( _Repeat, target )
+
+  def Sequence( self, target, children ):
+    return self.profile( super().Sequence( target, children ), target )
+
+  def Push( self, target, children ):
+    return self.profile( super().Push( target, children ), target )
+
+    # Rule tree of 'rule' in the layout of ReprVisitor with the stats of each rule
+  def report( self, rule ):
+    return ProfileVisitor( self.stats ).visit( rule, True )
+
+    # Named rules (as in the .lang file) and 'terminals' by decreasing time
+  def table( self, limit = None ):
+    named = { ( "'%s'" % rule.name if isinstance( rule, Terminal ) else rule.name ) : stats
+                for rule, stats in self.stats.items() if getattr( rule, 'name', None ) is not None }
+    rows = sorted( named.items(), key = lambda item: item[1].time, reverse = True )[:limit]
+    width = max( [ len( str(name) ) for name, stats in rows ] + [ 4 ] )
+    lines = [ '%-*s %9s %9s %9s %10s %10s %10s' % ( width, 'rule', 'calls', 'ok', 'failed', 'backtracks', 'time ms', 'own ms' ) ]
+    lines.extend( '%-*s %9d %9d %9d %10d %10.2f %10.2f' % ( width, name, stats.calls, stats.successes, stats.failures,
+                    stats.backtracks, stats.time * 1e3, stats.own * 1e3 ) for name, stats in rows )
+    return '\n'.join( lines )
+
+class ProfileVisitor( ReprVisitor ):
+  def __init__( self, stats ):
+    super().__init__()
+    self.stats = stats
+
+  def label( self, rule ):
+    stats = self.stats.get( rule )
+    return self.getname( rule ) + ( '' if stats is None else '  ' + repr( stats ) )
@@ -4,6 +4,7 @@ class Stack2args:
   def __init__(self, function , nargs ):
     self.function = function
     self.nargs    = nargs
+    self.__module__ = function.__module__
     
   def __call__( self, state ):
     args = state.stack[-self.nargs:]
@@ -12,6 +13,10 @@ class Stack2args:
         
   def __repr__( self ):
     return '<Stack2args(' + str(self.function) + ',' + str(self.nargs) + ')>'
+
+    # stack2args replaces the decorated function in its module, pickle it by that name
+  def __reduce__( self ):
+    return self.function.__qualname__
     
     
 # Convert handler function from signature (evaluator) to (evaluator, a1, a2, ..., aNargs)    
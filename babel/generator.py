@@ -0,0 +1,282 @@
+import hashlib
+import importlib.util
+import os
+import re
+import types
+
+import babel.rule as r
+from babel.ParserBuilder import First
+
+__all__ = [ 'Generator', 'generate', 'load' ]
+
+# Generates the source of a Python module that parses a grammar
+# with the same semantics as compiler.Sentinel.
+# Instead of nested closures, each named rule becomes one function,
+# anonymous rules are inlined into it and terminals are called directly.
+# Rules that are shared or recursive get a function of their own as well.
+# Rules return FAIL when they do not match, so backtracking is a comparison, not an exception,
+# and a failed child skips the rest of its Sequence through flat 'if' blocks.
+# With the terminals, the characters that can start each rule ( see ParserBuilder.First ) are
+# written into the module: Alternative only tries the branches that can start with the next
+# character, Optional and Repeat stop without trying their rule, as compiler.Lookahead does.
+#
+# The generated module defines:
+#   bind( terminals ) - binds the terminal table, raises RuntimeError for missing terminals
+#   Parse( state )    - entry point, raises ParserFailedException
+#                       Parse.attempt returns FAIL instead, and Parse.first gives the first
+#                       characters, so the grammar can serve as a terminal of another one
+
+class Generator:
+    # nesting of inlined rules after which a rule gets its own function
+    # Python limits the number of nested blocks of a function to 20
+  max_depth = 8
+
+  def __init__( self, terminals = None ):
+    self._names     = {}  # rule -> function name
+    self._emitted   = set()
+    self._pending   = []  # rules that need a function
+    self._terminals = {}  # terminal name -> global name
+    self._sets      = {}  # characters -> global name of their frozenset
+    self._counter   = 0
+    self._shared    = set()
+    self._first     = First( {} if terminals is None else terminals )
+
+  def __call__( self, rule ):
+    self._shared = self.shared( rule )
+    entry = self.function( rule )
+    functions = []
+    while len(self._pending) > 0:
+      target = self._pending.pop()
+      if target not in self._emitted:
+        self._emitted.add( target )
+        functions.append( self.define( target ) )
+
+    lines = [
+      '# Generated by babel.generator - do not edit',
+      'import re',
+      'from babel.terminal import ParserFailedException',
+      'from babel.terminal import FAIL',
+      'from babel.terminal import attempting',
+      ''
+    ]
+    for chars, name in self._sets.items():
+      lines.append( '%s = frozenset( %r )' % ( name, chars ) )
+    lines.append( '' )
+    lines.append( 'def bind( terminals ):' )
+    names = sorted( self._terminals.items() )
+    if len(names) > 0:
+      lines.append( '  global ' + ', '.join( name for key, name in names ) )
+      lines.append( '  for key in %r:' % ( tuple( key for key, name in names ), ) )
+      lines.append( '    if key not in terminals:' )
+      lines.append( "      raise RuntimeError('Missing terminal during compilation: ' + key)" )
+      for key, name in names:
+        lines.append( '  %s = attempting( terminals[%r] )' % ( name, key ) )
+    lines.append( '  return Parse' )
+    lines.append( '' )
+    for function in functions:
+      lines.extend( function )
+      lines.append( '' )
+    first = self._first.patterns( rule )
+    lines.extend( [
+      'def Parse( state ):',
+      '  result = %s( state )' % entry,
+      '  if result is FAIL:',
+      "    raise ParserFailedException('Parser failed')",
+      '  return result',
+      '',
+      'Parse.attempt = ' + entry,
+      'Parse.first = ' + ( 'None' if first is None else '( re.compile( %r ), )' % first[0].pattern )
+    ] )
+    return '\n'.join( lines ) + '\n'
+
+    # rules referenced from more than one place, including recursive references
+  def shared( self, rule ):
+    seen, shared = set(), set()
+    stack = [ rule ]
+    while len(stack) > 0:
+      target = stack.pop()
+      if target in seen:
+        shared.add( target )
+        continue
+      seen.add( target )
+      stack.extend( target )
+    shared.add( rule )
+    return shared
+
+  def function( self, rule ):
+    if rule not in self._names:
+      try:
+        name = 'rule_' + re.sub( '\\W', '_', rule.name )
+      except AttributeError:
+        name = 'rule'
+      self._counter += 1
+      self._names[rule] = '%s_%d' % ( name, self._counter )
+      self._pending.append( rule )
+    return self._names[rule]
+
+  def terminal( self, name ):
+    if name not in self._terminals:
+      self._terminals[name] = 't_' + re.sub( '\\W', '_', name ) + '_%d' % len(self._terminals)
+    return self._terminals[name]
+
+  def variable( self, prefix ):
+    self._counter += 1
+    return '%s%d' % ( prefix, self._counter )
+
+    # global name of the set of characters that can start 'rule', None if any character can
+  def starts( self, rule ):
+    chars, nullable = self._first( rule )
+    if chars is None or nullable:
+      return None
+    chars = ''.join( sorted( chars ) )
+    if chars not in self._sets:
+      self._sets[chars] = 'first_%d' % len(self._sets)
+    return self._sets[chars]
+
+    # expression of the next character of the input, '' at its end
+  def next( self ):
+    return "( state.buffer[state.pos:state.pos+1] if state.pos < state.end else '' )"
+
+  def define( self, rule ):
+    lines = [ 'def %s( state ):' % self._names[rule] ]
+    result = self.variable( 'r' )
+    lines.extend( self.emit( getattr( self, type(rule).__name__ ), rule, result, 1, 0 ) )
+    lines.append( '  return ' + result )
+    return lines
+
+    # lines that assign the result of 'rule' to 'result', FAIL if it does not match
+  def inline( self, rule, result, indent, depth ):
+    own = rule in self._shared or hasattr( rule, 'name' ) or depth > self.max_depth
+    if own and not isinstance( rule, r.Terminal ):
+      return [ '  ' * indent + '%s = %s( state )' % ( result, self.function( rule ) ) ]
+    name = type(rule).__name__
+    if not hasattr( self, name ):
+      raise RuntimeError("Generator does not support building of type " + name )
+    return self.emit( getattr( self, name ), rule, result, indent, depth )
+
+  def emit( self, method, rule, result, indent, depth ):
+    return [ '  ' * indent + line for line in method( rule, result, depth + 1 ) ]
+
+    # returns a child's lines indented by 'indent' blocks relative to its parent
+  def child( self, rule, result, depth, indent = 0 ):
+    return [ '  ' * indent + line for line in self.inline( rule, result, 0, depth ) ]
+
+    # lines that execute the deferred functions in 'sequence', 'result' is FAIL if one of them fails
+  def execute( self, sequence, result ):
+    return [
+      'try:',
+      '  for f in %s:' % sequence,
+      '    f( state )',
+      '  %s = ()' % result,
+      'except ParserFailedException:',
+      '  %s = FAIL' % result
+    ]
+
+  def Terminal( self, rule, result, depth ):
+    return [ '%s = %s( state )' % ( result, self.terminal( rule.name ) ) ]
+
+  def Handle( self, rule, result, depth ):
+    return self.child( rule.rule, result, depth )
+
+  def Not( self, rule, result, depth ):
+    item = self.variable( 'n' )
+    lines = self.child( rule.rule, item, depth )
+    lines.append( '%s = () if %s is FAIL else FAIL' % ( result, item ) )
+    return lines
+
+  def Optional( self, rule, result, depth ):
+    save, item, chars = self.variable( 'save' ), self.variable( 'o' ), self.starts( rule.rule )
+    lines = [ '%s = ()' % result ]
+    indent = 0
+    if chars is not None:
+      lines.append( 'if %s in %s:' % ( self.next(), chars ) )
+      indent = 1
+    body = [ '%s = state.save()' % save ]
+    body.extend( self.child( rule.rule, item, depth ) )
+    body.extend( [
+      'if %s is FAIL:' % item,
+      '  state.load( %s )' % save,
+      'else:',
+      '  %s = %s' % ( result, item )
+    ] )
+    lines.extend( '  ' * indent + line for line in body )
+    return lines
+
+  def Alternative( self, rule, result, depth ):
+    char, save = self.variable( 'c' ), self.variable( 'save' )
+    lines = [ '%s = FAIL' % result, '%s = %s' % ( char, self.next() ) ]
+    for child in rule:
+      chars = self.starts( child )
+      lines.append( 'if %s is FAIL%s:' % ( result, '' if chars is None else ' and %s in %s' % ( char, chars ) ) )
+      lines.append( '  %s = state.save()' % save )
+      lines.extend( self.child( child, result, depth, 1 ) )
+      lines.extend( [ '  if %s is FAIL:' % result, '    state.load( %s )' % save ] )
+    return lines
+
+  def Repeat( self, rule, result, depth ):
+    sequence, save, item, chars = self.variable( 'seq' ), self.variable( 'save' ), self.variable( 'i' ), self.starts( rule.rule )
+    lines = [ '%s = []' % sequence, 'while True:' ]
+    if chars is not None:
+      lines.extend( [ '  if %s not in %s:' % ( self.next(), chars ), '    break' ] )
+    lines.append( '  %s = state.save()' % save )
+    lines.extend( self.child( rule.rule, item, depth, 1 ) )
+    lines.extend( [
+      '  if %s is FAIL:' % item,
+      '    state.load( %s )' % save,
+      '    break',
+      '  %s.extend( %s )' % ( sequence, item ),
+      '%s = tuple( %s )' % ( result, sequence )
+    ] )
+    return lines
+
+    # the children run one after the other while none fails, each in an 'if' block of the same
+    # depth, so long sequences do not nest
+  def Sequence( self, rule, result, depth ):
+    sequence = self.variable( 'seq' )
+    lines = [ '%s = []' % sequence ]
+    for index, child in enumerate( rule ):
+      item = self.variable( 's' )
+      indent = 0 if index == 0 else 1
+      if index > 0:
+        lines.append( 'if %s is not FAIL:' % sequence )
+      lines.extend( self.child( child, item, depth, indent ) )
+      lines.extend( '  ' * indent + line for line in [ 'if %s is FAIL:' % item, '  %s = FAIL' % sequence ] )
+      if not isinstance( child, ( r.Sequence, r.Push ) ): # these always return () when they match
+        lines.extend( '  ' * indent + line for line in [ 'else:', '  %s.extend( %s )' % ( sequence, item ) ] )
+    lines.extend( [ 'if %s is FAIL:' % sequence, '  %s = FAIL' % result, 'else:' ] )
+    lines.extend( '  ' + line for line in self.execute( sequence, result ) )
+    return lines
+
+  def Push( self, rule, result, depth ):
+    item = self.variable( 'p' )
+    lines = self.child( rule.rule, item, depth )
+    lines.extend( [ 'if %s is FAIL:' % item, '  %s = FAIL' % result, 'else:' ] )
+    lines.extend( '  ' + line for line in self.execute( item, result ) )
+    return lines
+
+  # Source of the module for 'rule', with the first characters of the rules if 'terminals' are given
+def generate( rule, terminals = None ):
+  return Generator( terminals )( rule )
+
+  # Generates the module for 'rule', binds the terminals and returns its Parse function
+  # With a directory the module is written to <directory>/babel_<name>_<hash>.py and imported,
+  # so later loads of an unchanged grammar reuse the file and its bytecode
+def load( rule, terminals, directory = None ):
+  source = generate( rule, terminals )
+  digest = hashlib.sha1( source.encode('utf-8') ).hexdigest()[:16]
+  name = 'babel_%s_%s' % ( re.sub( '\\W', '_', getattr( rule, 'name', 'rule' ) ), digest )
+  if directory is None:
+    module = types.ModuleType( name )
+    exec( compile( source, '<' + name + '>', 'exec' ), module.__dict__ )
+  else:
+    path = os.path.join( directory, name + '.py' )
+    if not os.path.exists( path ):
+      os.makedirs( directory, exist_ok = True )
+      temporary = path + '.%d.tmp' % os.getpid()
+      with open( temporary, 'w' ) as file:
+        file.write( source )
+      os.replace( temporary, path )
+    spec = importlib.util.spec_from_file_location( name, path )
+    module = importlib.util.module_from_spec( spec )
+    spec.loader.exec_module( module )
+  return module.bind( terminals )
@@ -0,0 +1,174 @@
+import copy
+import re
+
+from babel.terminal import Lookup
+from babel.terminal import Switch
+from babel.terminal import If
+from babel.terminal import Wrapper
+from babel.terminal import Ignore
+from babel.terminal import SubMatch
+from babel.terminal import backreference
+from babel.terminal import first_chars
+
+__all__ = [ 'Lexer' ]
+
+  # Lexer stage of a grammar - splits a line into tokens in one pass of a master pattern
+  # The master pattern is the alternation of the patterns of the given terminals ('first' of
+  # Lookup, Switch, If and of terminals like languages.expression.pratt.Expression), in order,
+  # so the token at a position is the first of those patterns that matches there. Spaces
+  # between tokens are skipped, a character no pattern matches is a token of its own.
+  # Tokens are ( kind, match, end ) by position, the kind is the index of the pattern.
+  # Terminals made by lexed() match a pattern of kind k at a token of kind:
+  #   k        - the match of the token, without a regex call
+  #   above k  - nothing, the master pattern tried k at the position before the token's pattern
+  #   below k  - nothing if k cannot start with the character there, otherwise with the
+  #              pattern itself, as at positions where no token starts
+  # and nothing at the end of the line, so lexed terminals match what the terminals do.
+  # Tokens are scanned from the position of the first match in a line, once per line -
+  # per buffer and end, so states that keep the buffer (Cursor, Journal, Recorder) scan once.
+  # Patterns that cannot be part of the master pattern (named groups, backreferences, other
+  # flags, empty matches) are matched as before.
+class Lexer:
+  def __init__( self, terminals ):
+    self.patterns = []
+    self._kinds   = {}   # ( pattern, flags ) -> kind
+    flags = None
+    for terminal in terminals:
+      for pattern in getattr( terminal, 'first', None ) or ():
+        key = pattern.pattern, pattern.flags
+        if key in self._kinds or not isinstance( pattern.pattern, str ) or pattern.groupindex \
+           or backreference.search( pattern.pattern ) or first_chars( pattern )[1] or flags not in ( None, pattern.flags ):
+          continue
+        flags = pattern.flags
+        self._kinds[key] = len(self.patterns)
+        self.patterns.append( pattern )
+    self.master = re.compile( '[ ]+|' + ''.join( '(?P<_%d>%s)|' % ( kind, pattern.pattern ) for kind, pattern in enumerate( self.patterns ) )
+                                + '(?P<_x>(?s:.))', 0 if flags is None else flags )
+    self._names  = { '_%d' % kind : kind for kind in range( len(self.patterns) ) }
+    self._names['_x'] = len(self.patterns)
+    self._groups = [ ( self.master.groupindex['_%d' % kind], pattern.groups ) for kind, pattern in enumerate( self.patterns ) ]
+    self._first  = [ first_chars( pattern )[0] or None for pattern in self.patterns ]
+    self._buffer = None
+    self._start  = 0
+    self._end    = 0
+    self._tokens = {}
+    self.scans   = 0   # lines scanned
+    self.count   = 0   # tokens scanned
+
+  def kind( self, pattern ):
+    return self._kinds.get( ( pattern.pattern, pattern.flags ) )
+
+    # Tokens of the line of 'buffer' ending at 'end', scanned from 'pos' at the latest
+  def tokens( self, buffer, pos, end ):
+    if buffer is not self._buffer or end != self._end or pos < self._start:
+      names = self._names
+      self._tokens = { match.start() : ( names[match.lastgroup], match, match.end() )
+                         for match in self.master.finditer( buffer, pos, end ) if match.lastgroup is not None }
+      self._buffer, self._start, self._end = buffer, pos, end
+      self.scans += 1
+      self.count += len(self._tokens)
+    return self._tokens
+
+    # Function of ( buffer, pos, end ) that matches 'pattern' like pattern.match, through the tokens
+  def matcher( self, pattern ):
+    kind = self.kind( pattern )
+    if kind is None:
+      return pattern.match
+    group, count = self._groups[kind]
+    first = self._first[kind]
+    fallback = pattern.match
+    def _match( buffer, pos, end ):
+      if pos >= end:
+        return None
+      if buffer is self._buffer and end == self._end and pos >= self._start:
+        token = self._tokens.get( pos )
+      else:
+        token = self.tokens( buffer, pos, end ).get( pos )
+      if token is not None:
+        if token[0] == kind:
+          return SubMatch( token[1], group, count )
+        if token[0] > kind or first is not None and buffer[pos] not in first:
+          return None
+      return fallback( buffer, pos, end )
+    return _match
+
+    # Matcher of a list of patterns, tried in order, like babel.terminal.dispatch
+    # The outcome at a token whose kind decides it for every pattern is looked up in 'plans',
+    # otherwise the patterns are tried one by one
+  def dispatch( self, patterns, groups = True ):
+    table = []
+    for pattern in patterns:
+      kind = self.kind( pattern )
+      table.append( ( -1, 0, 0, None, pattern.match ) if kind is None else
+                      ( kind, ) + self._groups[kind] + ( self._first[kind], pattern.match ) )
+    plans = {}   # token kind -> ( index, group, count ) of the pattern that matches, or None
+    for token in range( len(self.patterns) + 1 ):
+      plan = self.plan( table, token )
+      if plan is not False:
+        plans[token] = plan
+    def _match( state ):
+      buffer, pos, end = state.buffer, state.pos, state.end
+      if pos >= end:
+        return None
+      if buffer is self._buffer and end == self._end and pos >= self._start:
+        token = self._tokens.get( pos )
+      else:
+        token = self.tokens( buffer, pos, end ).get( pos )
+      if token is not None:
+        try:
+          plan = plans[token[0]]
+        except KeyError:
+          pass
+        else:
+          if plan is None:
+            return None
+          index, group, count = plan
+          state.advance( token[2] )
+          return index, SubMatch( token[1], group, count ) if groups else None
+      for index, ( kind, group, count, first, fallback ) in enumerate( table ):
+        if token is not None and kind >= 0:
+          if token[0] == kind:
+            match = SubMatch( token[1], group, count )
+            state.advance( match.end() )
+            return index, match
+          if token[0] > kind or first is not None and buffer[pos] not in first:
+            continue
+        match = fallback( buffer, pos, end )
+        if match is not None:
+          state.advance( match.end() )
+          return index, match
+      return None
+    return _match
+
+    # ( index, group, count ) of the pattern of 'table' that matches at a token of kind 'token',
+    # None if none does, False if that depends on more than the kind
+  def plan( self, table, token ):
+    chars = self._first[token] if token < len(self.patterns) else None
+    for index, ( kind, group, count, first, fallback ) in enumerate( table ):
+      if kind == token:
+        return index, group, count
+      if kind < 0 or kind > token and ( first is None or chars is None or not chars.isdisjoint( first ) ):
+        return False
+    return None
+
+    # Terminal that matches its patterns through the tokens
+    # Terminals other than Lookup, Switch, If and their wrappers provide lexed( lexer ), or are kept
+  def lexed( self, terminal ):
+    if isinstance( terminal, ( Lookup, Switch, If ) ):
+      result = copy.copy( terminal )
+      result._match = self.dispatch( terminal.first, not isinstance( terminal, Lookup ) )
+      return result
+    if isinstance( terminal, ( Wrapper, Ignore ) ):
+      result = copy.copy( terminal )
+      if isinstance( terminal, Wrapper ):
+        result.wrapped = self.lexed( terminal.wrapped )
+      else:
+        result.ignored = self.lexed( terminal.ignored )
+      return result
+    if hasattr( terminal, 'lexed' ):
+      return terminal.lexed( self )
+    return terminal
+
+    # Terminal table with every terminal lexed
+  def table( self, terminals ):
+    return { name : self.lexed( terminal ) for name, terminal in terminals.items() }
@@ -0,0 +1,168 @@
+import collections
+
+import babel.rule as r
+
+__all__ = [ 'Optimizer', 'optimize' ]
+
+  # Rewrites a rule graph, as read by babel.lang.parser.parseStr, into a smaller one with
+  # the same results for every compiler. The rewrites, repeated until none applies:
+  #   handle       Handle( x )              -> x                   (Handles are forward references)
+  #   push         Push( x )                -> x                   if x executes its own effects
+  #   optional     Optional( Repeat( x ) )  -> Repeat( x ),  Optional( Optional( x ) ) -> Optional( x )
+  #   alternative  Alternative( a / Alternative( b / c ) / d ) -> Alternative( a / b / c / d ),
+  #                Alternative( x ) -> x
+  #   factor       a b / a c / d            -> a ( b / c ) / d
+  # A rule executes its own effects if it always returns no deferred functions: Sequence and
+  # Push execute (or record) them. Left factoring is restricted to consecutive branches that
+  # are Sequences. A rest of more than one rule becomes a Sequence, which executes before the
+  # common prefix; that is allowed only when the prefix executes its own effects, so the
+  # effects keep their order. A branch that is the prefix alone makes the rests Optional.
+  # A rewritten rule keeps the name of the rule it replaces, unless it has one of its own.
+  # 'counts' counts the rewrites of each kind.
+class Optimizer:
+  def __init__( self ):
+    self.counts = collections.Counter()
+
+    # Optimizes the rules of a grammar symtable ( name -> rule ) in place, returns the symtable
+  def __call__( self, symtable ):
+    changed = True
+    while changed:
+      changed = False
+      for node in nodes( symtable.values() ):
+        if isinstance( node, r.Unary ):
+          rule = self.simplify( node.rule )
+          if rule is not node.rule:
+            node.rule = rule
+            changed = True
+        elif isinstance( node, r.Nary ):
+          rules = tuple( self.simplify( rule ) for rule in node.rules )
+          if isinstance( node, r.Alternative ):
+            rules = self.factor( self.flatten( rules ) )
+          if len(rules) != len(node.rules) or any( a is not b for a, b in zip( rules, node.rules ) ):
+            node.rules = rules
+            changed = True
+      for name, rule in symtable.items():
+        symtable[name] = self.simplify( rule )
+    return symtable
+
+    # The rule that replaces 'rule', or 'rule'
+  def simplify( self, rule ):
+    while True:
+      kind = type(rule)
+      if kind is r.Handle and rule.rule is not None and rule.rule is not rule:
+        replacement = self.count( 'handle', rule.rule )
+      elif kind is r.Push and executes( rule.rule ):
+        replacement = self.count( 'push', rule.rule )
+      elif kind is r.Optional and type(rule.rule) in ( r.Repeat, r.Optional ):
+        replacement = self.count( 'optional', rule.rule )
+      elif kind is r.Alternative and len(rule.rules) == 1:
+        replacement = self.count( 'alternative', rule.rules[0] )
+      else:
+        return rule
+      if getattr( replacement, 'name', None ) is None and getattr( rule, 'name', None ) is not None:
+        replacement.name = rule.name
+      rule = replacement
+
+  def count( self, kind, rule ):
+    self.counts[kind] += 1
+    return rule
+
+  def flatten( self, rules ):
+    result = []
+    for rule in rules:
+      if type(rule) is r.Alternative:
+        self.counts['alternative'] += 1
+        result.extend( rule.rules )
+      else:
+        result.append( rule )
+    return tuple( result )
+
+    # Left factors consecutive Sequence branches that begin with the same rules
+  def factor( self, rules ):
+    result = []
+    i = 0
+    while i < len(rules):
+      j = i + 1
+      if type(rules[i]) is r.Sequence:
+        while j < len(rules) and type(rules[j]) is r.Sequence and same( rules[j].rules[0], rules[i].rules[0] ):
+          j += 1
+      if j - i < 2:
+        result.append( rules[i] )
+        i += 1
+        continue
+      group = [ rule.rules for rule in rules[i:j] ]
+      length = 1
+      while all( len(rules_) > length and same( rules_[length], group[0][length] ) for rules_ in group ):
+        length += 1
+      prefix = group[0][:length]
+      rests = [ rules_[length:] for rules_ in group ]
+      if any( len(rest) > 1 for rest in rests ) and not all( executes( rule ) for rule in prefix ):
+        result.append( rules[i] )
+        i += 1
+        continue
+      branches = []
+      for rest in rests:
+        if len(rest) == 0:
+          break
+        branches.append( rest[0] if len(rest) == 1 else r.Sequence( *rest ) )
+      if len(branches) == 0:
+        result.append( rules[i] )  # the first branch is the prefix, the others are unreachable
+      else:
+        tail = branches[0] if len(branches) == 1 else r.Alternative( *branches )
+        if len(branches) < len(rests):
+          tail = r.Optional( tail )
+        result.append( r.Sequence( *prefix, tail ) )
+      self.counts['factor'] += 1
+      i = j
+    return tuple( result )
+
+  # Optimizes the rules of a grammar symtable in place, see Optimizer
+def optimize( symtable ):
+  return Optimizer()( symtable )
+
+  # Rules reachable from 'roots', each once
+def nodes( roots ):
+  result, seen, stack = [], set(), list( roots )
+  while len(stack) > 0:
+    rule = stack.pop()
+    if rule is None or id(rule) in seen:
+      continue
+    seen.add( id(rule) )
+    result.append( rule )
+    stack.extend( rule )
+  return result
+
+  # Does the rule always return no deferred functions
+  # Rules that are still being visited (recursion) are assumed not to
+def executes( rule, visiting = None ):
+  kind = type(rule)
+  if kind in ( r.Sequence, r.Push ):
+    return True
+  if kind is r.Terminal or rule is None:
+    return False
+  visiting = set() if visiting is None else visiting
+  if id(rule) in visiting:
+    return False
+  visiting.add( id(rule) )
+  if kind in ( r.Handle, r.Optional, r.Repeat ):
+    return executes( rule.rule, visiting )
+  if kind is r.Alternative:
+    return all( executes( child, visiting ) for child in rule.rules )
+  return False
+
+  # Do two rules parse the same input with the same results
+  # Terminals are the same if they have the same name, other rules if they have the same type
+  # and the same children. Rules that are still being compared (recursion) are assumed the same.
+def same( a, b, comparing = None ):
+  if a is b:
+    return True
+  if type(a) is not type(b):
+    return False
+  if type(a) is r.Terminal:
+    return a.name == b.name
+  comparing = set() if comparing is None else comparing
+  if ( id(a), id(b) ) in comparing:
+    return True
+  comparing.add( ( id(a), id(b) ) )
+  children = list( a ), list( b )
+  return len(children[0]) == len(children[1]) and all( same( x, y, comparing ) for x, y in zip( *children ) )
@@ -13,8 +13,9 @@ class Rule:
    return self.__repr__() + (ReprVisitor().visit(self, True))
    
   def compile( self, compiler ):
+    compiler.prepare( self )
     builder = ParserBuilder( compiler )
-    return builder( self )
+    return compiler.entry( builder( self ) )
       
 class Unary(Rule):
   __slots__ = '_rule'
@@ -0,0 +1,38 @@
+import mmap
+import os
+
+__all__ = [ 'mapped_lines' ]
+
+  # Yields ( buffer, start, end ) for each line of the file at 'path', to be parsed in place
+  # with Cursor( buffer, start, end ) or Journal( buffer, start, end )
+  # The file is memory-mapped and decoded in chunks of about 'chunksize' bytes that end
+  # on a line boundary. Lines of a chunk share its buffer, no line is copied, and only
+  # the chunk being parsed is resident - the mapping is paged in and out by the OS.
+  # latin-1 decodes any byte, one character per byte, so controller files with 8-bit
+  # characters in comments or program names parse without decoding errors.
+  # Line ends ('\n' or '\r\n') are not part of the span.
+def mapped_lines( path, chunksize = 1 << 20, encoding = 'latin-1' ):
+  with open( path, 'rb' ) as file:
+    size = os.fstat( file.fileno() ).st_size
+    if size == 0:
+      return
+    with mmap.mmap( file.fileno(), 0, access = mmap.ACCESS_READ ) as data:
+      begin = 0
+      while begin < size:
+        cut = data.find( b'\n', min( begin + chunksize, size ) - 1 )
+        cut = size if cut < 0 else cut + 1
+        with memoryview( data ) as view:
+          buffer = str( view[begin:cut], encoding )
+        begin = cut
+        yield from lines( buffer )
+
+  # Yields ( buffer, start, end ) for each line of a decoded buffer
+def lines( buffer ):
+  find, start = buffer.find, 0
+  stop = find( '\n' )
+  while stop >= 0:
+    yield buffer, start, ( stop - 1 if stop > start and buffer[stop - 1] == '\r' else stop )
+    start = stop + 1
+    stop = find( '\n', start )
+  if start < len(buffer):
+    yield buffer, start, ( len(buffer) - 1 if buffer[-1] == '\r' else len(buffer) )
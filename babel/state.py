@@ -1,7 +1,17 @@
-__all__ = [ 'State' ]
+import sys
 
+__all__ = [ 'State', 'Cursor', 'Journal', 'Recorder' ]
+
+  # Terminals consume input through buffer, pos, end and advance( end ):
+  #   match = pattern.match( state.buffer, state.pos, state.end )
+  #   state.advance( match.end() )
+  # Leading spaces are skipped after each advance
 class State:
   __slots__ = '__input', 'stack', 'symtable'
+    # input is always the unparsed rest of the line
+  pos = 0
+  end = sys.maxsize
+  
   def __init__(self, input):
     self.input = input
     self.symtable = {}
@@ -27,6 +37,255 @@ class State:
   def input( self, value ):
     self.__input = value.lstrip(' ')
 
+  @property
+  def buffer( self ):
+    return self.__input
+
+    # length of the unparsed input, identifies the position within a line
+  @property
+  def remaining( self ):
+    return len(self.__input)
+
+  def advance( self, end ):
+    self.input = self.__input[end:]
+
+  # State variant that holds an immutable buffer and an integer position in it
+  # Consuming a token only moves the position and save/load record it as an integer,
+  # instead of copying the rest of the line.
+  # 'end' limits the parsed part of the buffer, so lines of a whole file can be parsed in place
+class Cursor:
+  __slots__ = 'buffer', 'pos', 'end', 'stack', 'symtable'
+  def __init__( self, buffer, pos = 0, end = None ):
+    self.buffer = buffer
+    self.end = len(buffer) if end is None else end
+    self.advance( pos )
+    self.symtable = {}
+    self.stack = []
+
+  def save( self ):
+    return ( self.pos, self.stack[:], dict( self.symtable ) )
+
+  def load( self, saved ):
+    self.pos, self.stack, self.symtable = saved
+
+    # compatibility with terminals that read and rebind state.input
+  @property
+  def input( self ):
+    return self.buffer[self.pos:self.end]
+
+  @input.setter
+  def input( self, value ):
+    self.buffer = value
+    self.end = len(value)
+    self.advance( 0 )
+
+  @property
+  def remaining( self ):
+    return self.end - self.pos
+
+  def advance( self, end ):
+    buffer, stop = self.buffer, self.end
+    while end < stop and buffer[end] == ' ':
+      end += 1
+    self.pos = end
+
+  # Cursor variant that journals every change of the stack and the symtable on a trail
+  # save() returns a mark - the position and the length of the trail
+  # load() undoes the trail back to the mark, so the cost of backtracking
+  # depends on the work done since the mark, not on the size of the state
+class Journal( Cursor ):
+  __slots__ = 'trail', '_symtable'
+  def __init__( self, buffer, pos = 0, end = None ):
+    self.trail = []
+    super().__init__( buffer, pos, end )
+    self.stack = TrailList( self.trail )
+    del self.trail[:]
+
+  def save( self ):
+    return ( self.pos, len(self.trail) )
+
+  def load( self, saved ):
+    self.pos, mark = saved
+    trail = self.trail
+    while len(trail) > mark:
+      undo, target, key, value = trail.pop()
+      undo( target, key, value )
+
+    # discard the trail, the current state can no longer be undone
+  def commit( self ):
+    del self.trail[:]
+
+  @property
+  def symtable( self ):
+    return self._symtable
+
+  @symtable.setter
+  def symtable( self, value ):
+    if type(value) is not TrailDict or value.trail is not self.trail:
+      value = TrailDict( self.trail, value )
+    try:
+      self.trail.append( ( _set_symtable, self, None, self._symtable ) )
+    except AttributeError:
+      pass  # set for the first time
+    self._symtable = value
+
+  @Cursor.input.setter
+  def input( self, value ):
+    Cursor.input.fset( self, value )
+    self.commit()
+
+  # Cursor variant for parsers compiled with compiler.Recording
+  # The deferred functions that would be executed on the state are appended to 'effects'
+  # in execution order instead, and backtracking drops the effects recorded since the mark.
+  # Executing the effects on another state later has the same result as parsing on it,
+  # as long as rules choose their alternatives from the input alone
+class Recorder( Cursor ):
+  __slots__ = 'effects'
+  def __init__( self, buffer, pos = 0, end = None ):
+    super().__init__( buffer, pos, end )
+    self.effects = []
+
+  def save( self ):
+    return ( self.pos, len(self.effects) )
+
+  def load( self, saved ):
+    self.pos, mark = saved
+    del self.effects[mark:]
+
+  # Undo operations stored on the trail as ( undo, target, key, value )
+def _truncate( target, length, value ):
+  list.__delitem__( target, slice(length, None) )
+
+def _insert( target, start, removed ):
+  list.__setitem__( target, slice(start, start), removed )
+
+def _set_item( target, index, value ):
+  list.__setitem__( target, index, value )
+
+def _set_list( target, key, items ):
+  list.__setitem__( target, slice(None), items )
+
+_missing = object()
+
+def _set_key( target, key, value ):
+  if value is _missing:
+    dict.__delitem__( target, key )
+  else:
+    dict.__setitem__( target, key, value )
+
+def _set_dict( target, key, items ):
+  dict.clear( target )
+  dict.update( target, items )
+
+def _set_symtable( target, key, value ):
+  target._symtable = value
+
+  # list that records the undo operation of every change on a trail
+class TrailList( list ):
+  __slots__ = 'trail'
+  def __init__( self, trail, items = () ):
+    super().__init__( items )
+    self.trail = trail
+
+  def append( self, value ):
+    self.trail.append( ( _truncate, self, len(self), None ) )
+    list.append( self, value )
+
+  def extend( self, values ):
+    self.trail.append( ( _truncate, self, len(self), None ) )
+    list.extend( self, values )
+
+  def __iadd__( self, values ):
+    self.extend( values )
+    return self
+
+  def __setitem__( self, key, value ):
+    if type(key) is int:
+      key = range(len(self))[key]
+      self.trail.append( ( _set_item, self, key, list.__getitem__( self, key ) ) )
+    else:
+      self.trail.append( ( _set_list, self, None, list(self) ) )
+    list.__setitem__( self, key, value )
+
+  def __delitem__( self, key ):
+    if type(key) is int:
+      key = range(len(self))[key]
+      key = slice( key, key + 1 )
+    start, stop, step = key.indices( len(self) )
+    if step == 1:
+      self.trail.append( ( _insert, self, start, list.__getitem__( self, key ) ) )
+    else:
+      self.trail.append( ( _set_list, self, None, list(self) ) )
+    list.__delitem__( self, key )
+
+  def pop( self, index = -1 ):
+    value = self[index]
+    del self[index]
+    return value
+
+  def _snapshot( method ):
+    def _journaled( self, *args, **kwargs ):
+      self.trail.append( ( _set_list, self, None, list(self) ) )
+      return method( self, *args, **kwargs )
+    return _journaled
+
+  insert  = _snapshot( list.insert )
+  remove  = _snapshot( list.remove )
+  clear   = _snapshot( list.clear )
+  sort    = _snapshot( list.sort )
+  reverse = _snapshot( list.reverse )
+  __imul__ = _snapshot( list.__imul__ )
+  del _snapshot
+
+  # dict that records the undo operation of every change on a trail
+class TrailDict( dict ):
+  __slots__ = 'trail'
+  def __init__( self, trail, items = () ):
+    super().__init__( items )
+    self.trail = trail
+
+  def __setitem__( self, key, value ):
+    self.trail.append( ( _set_key, self, key, self.get( key, _missing ) ) )
+    dict.__setitem__( self, key, value )
+
+  def __delitem__( self, key ):
+    self.trail.append( ( _set_key, self, key, self[key] ) )
+    dict.__delitem__( self, key )
+
+  def update( self, *args, **kwargs ):
+    items = dict( *args, **kwargs )
+    if len(items) < len(self):
+      for key, value in items.items():
+        self[key] = value
+    else:
+        # cheaper to restore a copy than to journal each key
+      self.trail.append( ( _set_dict, self, None, dict(self) ) )
+      dict.update( self, items )
+
+  def setdefault( self, key, default = None ):
+    if key not in self:
+      self[key] = default
+    return self[key]
+
+  def pop( self, key, *default ):
+    if key in self:
+      value = self[key]
+      del self[key]
+      return value
+    return dict.pop( self, key, *default )
+
+  def _snapshot( method ):
+    def _journaled( self, *args, **kwargs ):
+      self.trail.append( ( _set_dict, self, None, dict(self) ) )
+      return method( self, *args, **kwargs )
+    return _journaled
+
+  popitem = _snapshot( dict.popitem )
+  clear   = _snapshot( dict.clear )
+  if hasattr( dict, '__ior__' ):
+    __ior__ = _snapshot( dict.__ior__ )
+  del _snapshot
+
 '''def do_copy( value ):
   if type( value ) is dict:
     raise RuntimeError('Dicts not supported by do_copy. Use State instead.')
@@ -1,11 +1,53 @@
 from copy import copy, deepcopy
+import re
+try:
+  import re._parser as sre_parse  # Python 3.11+
+except ImportError:
+  import sre_parse
 
-__all__ = [ 'ParserFailedException', 'Wrapper', 'Return', 'Switch', 'Lookup', 'If', 'Push', 'pushTerminals' ]
+__all__ = [ 'ParserFailedException', 'FAIL', 'attempting', 'Wrapper', 'Return', 'Switch', 'Lookup', 'If', 'Push', 'pushTerminals' ]
 
 class ParserFailedException(Exception):
   pass
 
+  # Result of a failed non-raising parser, see compiler.Sentinel
+class Failure:
+  __slots__ = ()
+  def __repr__( self ):
+    return '<FAIL>'
+
+FAIL = Failure()
+
+  # Returns the non-raising version of a terminal - a function that returns FAIL
+  # where the terminal raises ParserFailedException
+  # Terminals that implement 'attempt' are used directly, other callables are adapted
+def attempting( terminal ):
+  try:
+    return terminal.attempt
+  except AttributeError:
+    pass
+  def _attempt( state ):
+    try:
+      return terminal( state )
+    except ParserFailedException:
+      return FAIL
+  return _attempt
+
 class TerminalBase:
+    # Terminals consume input and return deferred functions
+    # without executing them, so their results can be memoized
+  pure = True
+    # Patterns one of which matches at the start of the consumed input
+    # None if unknown, or if the terminal can consume no input
+  first = None
+
+    # Non-raising call, returns FAIL instead of raising ParserFailedException
+  def attempt( self, state ):
+    try:
+      return self( state )
+    except ParserFailedException:
+      return FAIL
+
   def If( self, condition ):
     return If( condition, self )
     
@@ -16,6 +58,15 @@ class Ignore(TerminalBase):
   def __init__( self, ignored, returned = () ):
     self.ignored = ignored
     self.returned = returned
+
+  @property
+  def pure( self ):
+    return getattr( self.ignored, 'pure', False )
+
+  @property
+  def first( self ):
+    return getattr( self.ignored, 'first', None )
+
   def __call__( self, state ):
     self.ignored( state )
     return self.returned
@@ -25,76 +76,347 @@ class Return(TerminalBase):
     self.returned = returned
   def __call__( self, *args ):
     return self.returned
+
+  attempt = __call__
   
 class Wrapper(TerminalBase):
   def __init__( self, wrapped, wrapper ):
     self.wrapped = wrapped
     self.wrapper = wrapper
+
+  @property
+  def pure( self ):
+    return getattr( self.wrapped, 'pure', False )
+
+  @property
+  def first( self ):
+    return getattr( self.wrapped, 'first', None )
     
   def __call__( self, state ):
     result = self.wrapped( state )
     return self.wrapper( result ) 
 
+  def attempt( self, state ):
+    result = attempting( self.wrapped )( state )
+    if result is FAIL:
+      return FAIL
+    try:
+      return self.wrapper( result )
+    except ParserFailedException:
+      return FAIL
+
 class Lookup(TerminalBase):
   def __init__( self, lookup ):
-    self._lookup = lookup
+    self._lookup = list( lookup )
+    self.first = tuple( condition for condition, returned in self._lookup )
+    self._match = dispatch( self.first )
+    self._returned = [ returned for condition, returned in self._lookup ]
     
   def __deepcopy__( self, memo ):
     return copy( self )
     
   def __call__( self, state ):
-    for condition, returned in self._lookup:
-      match = condition.match( state.input )
-      if match is not None:
-        state.input = match.string[match.end(0):]
-        return returned
+    found = self._match( state )
+    if found is not None:
+      return self._returned[ found[0] ]
     
     raise ParserFailedException('Lookup exhausted with no matches')
+
+  def attempt( self, state ):
+    found = self._match( state )
+    if found is not None:
+      return self._returned[ found[0] ]
+    return FAIL
     
 class Switch(TerminalBase):
   def __init__( self, lookup ):
-    self._lookup = lookup
+    self._lookup = list( lookup )
+    self.first = tuple( condition for condition, callback in self._lookup )
+    self._match = dispatch( self.first, True )
+    self._callbacks = [ callback for condition, callback in self._lookup ]
     
   def __deepcopy__( self, memo ):
     return copy( self )
     
   def __call__( self, state ):
-    for condition,callback in self._lookup:
-      match = condition.match( state.input )
-      if match is not None:
-        state.input = match.string[match.end(0):]
-        return callback( match )
+    found = self._match( state )
+    if found is not None:
+      index, match = found
+      return self._callbacks[index]( match )
     
     raise ParserFailedException('Switch exhausted with no matches')
+
+  def attempt( self, state ):
+    found = self._match( state )
+    if found is None:
+      return FAIL
+    index, match = found
+    try:
+      return self._callbacks[index]( match )
+    except ParserFailedException:
+      return FAIL
     
 class If(TerminalBase):
   def __init__( self, condition, block ):
     self.condition = condition
     self.block = block
+    self.first = ( condition, )
+    self._match = dispatch( self.first, True )
     
   def __deepcopy__( self, memo ):
     return copy( self )
     
   def __call__( self, state ):
-    match = self.condition.match( state.input )
-    if match is not None:
-      state.input = match.string[match.end(0):]
-      return self.block( match )
+    found = self._match( state )
+    if found is not None:
+      return self.block( found[1] )
     
     raise ParserFailedException('If terminal did not match')
+
+  def attempt( self, state ):
+    found = self._match( state )
+    if found is None:
+      return FAIL
+    try:
+      return self.block( found[1] )
+    except ParserFailedException:
+      return FAIL
+
+  # Builds a matcher for a list of patterns, tried in order, that makes at most one regex call
+  # The matcher returns ( index of the matched pattern, match ) and advances the state,
+  # or None if no pattern matches. The match is only built if 'groups' is set.
+  # - tables of plain literals are matched with str.startswith through a first-character table
+  # - a single pattern is matched directly
+  # - other tables are merged into one alternation regex with a named group per pattern,
+  #   dispatched by match.lastgroup
+  # - patterns that cannot be merged (named groups, backreferences, different flags)
+  #   are tried one by one
+def dispatch( patterns, groups = False ):
+  literals = [ literal( pattern ) for pattern in patterns ]
+  if len(patterns) > 0 and all( text is not None for text in literals ):
+    return dispatch_literals( literals, groups )
+  if len(patterns) == 1:
+    return dispatch_single( patterns[0] )
+  try:
+    return dispatch_merged( patterns, groups )
+  except re.error:
+    return dispatch_each( patterns )
+
+def dispatch_literals( literals, groups ):
+  first = {}
+  for index, text in enumerate( literals ):
+    first.setdefault( text[0], [] ).append( ( text, index, len(text) ) )
+  def _match( state ):
+    buffer, pos = state.buffer, state.pos
+    for text, index, length in first.get( buffer[pos:pos+1], () ):
+      if buffer.startswith( text, pos, state.end ):
+        state.advance( pos + length )
+        return index, LiteralMatch( buffer, pos, pos + length ) if groups else None
+    return None
+  return _match
+
+def dispatch_single( pattern ):
+  def _match( state ):
+    match = pattern.match( state.buffer, state.pos, state.end )
+    if match is None:
+      return None
+    state.advance( match.end() )
+    return 0, match
+  return _match
+
+def dispatch_merged( patterns, groups ):
+  flags = { pattern.flags for pattern in patterns }
+  if len(flags) != 1 or any( pattern.groupindex or backreference.search( pattern.pattern ) for pattern in patterns ):
+    raise re.error('Patterns cannot be merged')
+  merged = re.compile( '|'.join( '(?P<_%d>%s)' % ( index, pattern.pattern ) 
+                                   for index, pattern in enumerate(patterns) ), flags.pop() )
+  index   = { '_%d' % i : i for i in range(len(patterns)) }
+  offsets = { '_%d' % i : ( merged.groupindex[ '_%d' % i ], pattern.groups ) for i, pattern in enumerate(patterns) }
+  def _match( state ):
+    match = merged.match( state.buffer, state.pos, state.end )
+    if match is None:
+      return None
+    state.advance( match.end() )
+    name = match.lastgroup
+    return index[name], SubMatch( match, *offsets[name] ) if groups else None
+  return _match
+
+def dispatch_each( patterns ):
+  def _match( state ):
+    buffer, pos, end = state.buffer, state.pos, state.end
+    for index, pattern in enumerate( patterns ):
+      match = pattern.match( buffer, pos, end )
+      if match is not None:
+        state.advance( match.end() )
+        return index, match
+    return None
+  return _match
+
+backreference = re.compile('\\\\\\d|[(][?]P[=]')
+
+  # Returns the text matched by the pattern if it is a plain literal, None otherwise
+def literal( pattern ):
+  if not isinstance( pattern.pattern, str ) or pattern.flags & ( re.IGNORECASE | re.VERBOSE ):
+    return None
+  try:
+    parsed = sre_parse.parse( pattern.pattern, pattern.flags )
+  except re.error:
+    return None
+  if len(parsed) == 0 or any( op != sre_parse.LITERAL for op, value in parsed ):
+    return None
+  return ''.join( chr(value) for op, value in parsed )
+
+  # Returns ( characters that can start a match of the pattern, can the pattern match empty input )
+  # The set of characters is None if it cannot be determined
+  # Results are kept per pattern, grammars that share terminals parse each pattern once
+def first_chars( pattern ):
+  key = pattern.pattern, pattern.flags
+  if key not in _first_memo:
+    _first_memo[key] = _first_pattern( pattern )
+  return _first_memo[key]
+
+_first_memo = {}
+
+def _first_pattern( pattern ):
+  if not isinstance( pattern.pattern, str ):
+    return None, True
+  try:
+    chars, nullable = _first_chars( sre_parse.parse( pattern.pattern, pattern.flags ), pattern.flags )
+  except re.error:
+    return None, True
+  return ( None if chars is None else frozenset( chars ) ), nullable
+
+_categories = {
+  sre_parse.CATEGORY_DIGIT : '0123456789',
+  sre_parse.CATEGORY_SPACE : ' \t\n\r\f\v'
+}
+
+def _first_chars( items, flags ):
+  chars, nullable = set(), True
+  for op, value in items:
+    if op == sre_parse.LITERAL:
+      item, nullable = { chr(value) }, False
+    elif op == sre_parse.IN:
+      item, nullable = _first_class( value ), False
+    elif op == sre_parse.SUBPATTERN:
+      item, nullable = _first_chars( value[-1], flags )
+    elif op == sre_parse.BRANCH:
+      branches = [ _first_chars( branch, flags ) for branch in value[1] ]
+      item = None if any( first is None for first, empty in branches ) else set().union( *( first for first, empty in branches ) )
+      nullable = any( empty for first, empty in branches )
+    elif op in ( sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT ):
+      item, nullable = _first_chars( value[2], flags )
+      nullable = nullable or value[0] == 0
+    elif op in ( sre_parse.AT, sre_parse.ASSERT, sre_parse.ASSERT_NOT ):
+      item, nullable = set(), True # zero-width
+    else:
+      item, nullable = None, True
+    if item is None:
+      return None, True
+    chars |= item
+    if not nullable:
+      break
+  if flags & re.IGNORECASE:
+    chars |= { char.swapcase() for char in chars }
+  return chars, nullable
+
+def _first_class( items ):
+  chars = set()
+  for op, value in items:
+    if op == sre_parse.LITERAL:
+      chars.add( chr(value) )
+    elif op == sre_parse.RANGE and value[1] - value[0] < 256:
+      chars.update( chr(code) for code in range( value[0], value[1] + 1 ) )
+    elif op == sre_parse.CATEGORY and value in _categories:
+      chars.update( _categories[value] )
+    else:
+      return None
+  return chars
+
+  # Match object of a literal pattern
+class LiteralMatch:
+  __slots__ = 'string', '_start', '_end'
+  def __init__( self, string, start, end ):
+    self.string = string
+    self._start = start
+    self._end = end
+
+  def groups( self, default = None ):
+    return ()
+
+  def _group( self, index ):
+    if index != 0:
+      raise IndexError('no such group')
+
+  def group( self, index = 0 ):
+    self._group( index )
+    return self.string[self._start:self._end]
+
+  __getitem__ = group
+
+  def start( self, index = 0 ):
+    self._group( index )
+    return self._start
+
+  def end( self, index = 0 ):
+    self._group( index )
+    return self._end
+
+  def span( self, index = 0 ):
+    return self.start( index ), self.end( index )
+
+  # Match object of one pattern of a merged table
+  # Group numbers are relative to the pattern, group 0 is the whole match
+class SubMatch:
+  __slots__ = '_match', '_offset', '_count'
+  def __init__( self, match, offset, count ):
+    self._match = match
+    self._offset = offset
+    self._count = count
+
+  @property
+  def string( self ):
+    return self._match.string
+
+  def groups( self, default = None ):
+    return self._match.groups( default )[ self._offset : self._offset + self._count ]
+
+  def _group( self, index ):
+    if not 0 <= index <= self._count:
+      raise IndexError('no such group')
+    return self._offset + index
+
+  def group( self, index = 0 ):
+    return self._match.group( self._group( index ) )
+
+  __getitem__ = group
+
+  def start( self, index = 0 ):
+    return self._match.start( self._group( index ) )
+
+  def end( self, index = 0 ):
+    return self._match.end( self._group( index ) )
+
+  def span( self, index = 0 ):
+    return self._match.span( self._group( index ) )
     
+  # Pushes are equal if they push equal values, so blocks that hold them compare by value
 class Push:
   def __init__(self, N ):
     self.value = N
   def __call__( self, state ):
     state.stack.append( self.value )
+  def __eq__( self, other ):
+    return type(other) is Push and self.value == other.value
+  def __ne__( self, other ):
+    return not self == other
+  def __hash__( self ):
+    return hash( self.value )
   def __repr__(self):
     return '<PUSH '+str(self.value)+'>'
 
 def push( value ):
-  def _push( state ):
-    state.stack.append( value )
-  return (_push,)
+  return (Push( value ),)
     
 def pushTerminals( terminals ):
   return { key : Wrapper( value, push ) for (key, value) in terminals.items() }
\ No newline at end of file
@@ -0,0 +1,6 @@
+from bench.suite import Scenario
+from bench.suite import scenario
+from bench.suite import scenarios
+from bench.suite import select
+from bench.suite import run
+from bench.suite import compare
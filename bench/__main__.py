@@ -0,0 +1,51 @@
+import argparse
+import sys
+
+from bench.suite import select
+from bench.suite import run
+from bench.suite import compare
+from bench.suite import load
+from bench.suite import save
+
+  # usage:
+  #   python -m bench list  [pattern ...] [--slow]
+  #   python -m bench run   [pattern ...] [--slow] [--repeat N] [-o results.json]
+  #   python -m bench compare old.json new.json [--threshold 0.1] [--stat best|median]
+  # patterns are shell-style, 'parse.*' selects the parse scenarios
+  # compare exits with status 1 if a scenario regressed
+def main( argv = None ):
+  parser = argparse.ArgumentParser( prog = 'python -m bench' )
+  commands = parser.add_subparsers( dest = 'command' )
+  listing = commands.add_parser( 'list' )
+  listing.add_argument( 'patterns', nargs = '*' )
+  listing.add_argument( '--slow', action = 'store_true', help = 'include the slow scenarios' )
+  running = commands.add_parser( 'run' )
+  running.add_argument( 'patterns', nargs = '*' )
+  running.add_argument( '--slow', action = 'store_true', help = 'include the slow scenarios' )
+  running.add_argument( '--repeat', type = int, default = None, help = 'timed runs per scenario' )
+  running.add_argument( '-o', '--output', default = None, help = 'JSON file for the results' )
+  comparing = commands.add_parser( 'compare' )
+  comparing.add_argument( 'old' )
+  comparing.add_argument( 'new' )
+  comparing.add_argument( '--threshold', type = float, default = 0.1, help = 'allowed slowdown, 0.1 is 10%%' )
+  comparing.add_argument( '--stat', choices = ( 'best', 'median' ), default = 'best' )
+  args = parser.parse_args( argv )
+
+  if args.command == 'list':
+    for value in select( args.patterns, args.slow ):
+      print( '%-28s %s%s' % ( value.name, value.unit, ' (slow)' if value.slow else '' ) )
+  elif args.command == 'run':
+    results = run( select( args.patterns, args.slow ), args.repeat )
+    if args.output is not None:
+      save( results, args.output )
+  elif args.command == 'compare':
+    rows = compare( load( args.old ), load( args.new ), args.threshold, args.stat )
+    for name, before, after, ratio, regressed in rows:
+      print( '%-28s %12.2f %12.2f us %7.2fx%s' % ( name, before * 1e6, after * 1e6, ratio, '  REGRESSION' if regressed else '' ) )
+    return 1 if any( row[4] for row in rows ) else 0
+  else:
+    parser.print_help()
+  return 0
+
+if __name__ == '__main__':
+  sys.exit( main() )
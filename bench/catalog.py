@@ -0,0 +1,198 @@
+import os
+import tempfile
+
+from bench.suite import scenario
+import bench.programs as programs
+
+  # The scenarios of the suite
+  # Modules under test are imported by the setup functions, so listing the scenarios is cheap
+
+  # Lines of each line type of the heidenhain grammar
+lines = {
+  'goto'       : 'L X+50 Y-30 Z+150 R0 FMAX',
+  'incremental': 'L IX+0.5 FMAX',
+  'short'      : 'X+10 Y+5 R0 F200',
+  'polar'      : 'LP PR+30 PA+20 DR- RL F500 M3',
+  'center'     : 'CC X+25 Y+25',
+  'tool_call'  : 'TOOL CALL 5 Z S3000',
+  'fn'         : 'FN 0: Q5 = Q1*2+Q2',
+  'aux'        : 'M8 M3',
+  'numbered'   : '1234 L X+50 Y-30 R0 F200 M3',
+}
+
+expressions = {
+  'number'     : '+12.5',
+  'arithmetic' : 'Q1*2+Q2',
+  'nested'     : '(Q1+3)*(Q2-1)/2^2',
+  'assign'     : 'Q5=Q1*2+3',
+}
+
+variables = { 'Q1' : 1.0, 'Q2' : 2.0 }
+
+  # Parses 'line' 'count' times, each on a new state
+def parsing( parser, line, count ):
+  from babel.state import Journal
+  state = Journal( line )
+  state.symtable.update( variables )
+  parser( state )
+  if state.remaining > 0:
+    raise RuntimeError( 'Benchmark line does not parse: ' + line )
+  def run():
+    for i in range( count ):
+      state = Journal( line )
+      state.symtable.update( variables )
+      parser( state )
+    return count
+  return run
+
+def line_scenario( kind, line ):
+  @scenario( 'parse.' + kind, unit = 'line' )
+  def setup():
+    import languages.heidenhain.parser as hh
+    return parsing( hh.Parse, line, 2000 )
+
+def expression_scenario( kind, text ):
+  @scenario( 'expression.' + kind, unit = 'expression' )
+  def setup():
+    import languages.expression.parser as expr
+    return parsing( expr.Parse, text, 5000 )
+
+    # the rules of expression.lang, that expr.Parse replaced
+  @scenario( 'expression.grammar.' + kind, unit = 'expression' )
+  def setup_grammar():
+    import languages.expression.parser as expr
+    import babel.compiler as c
+    return parsing( expr.build_grammar( c.Sentinel( expr.terminals ) )[0], text, 5000 )
+
+for kind, line in lines.items():
+  line_scenario( kind, line )
+for kind, text in expressions.items():
+  expression_scenario( kind, text )
+
+@scenario( 'hydra.construct' )
+def hydra_construct():
+  import hydra as h
+  import languages.heidenhain.state as machine
+  data = machine.StateDict()
+  def run():
+    for i in range( 200 ):
+      h.construct( machine.Motion, dict( data ) )
+    return 200
+  return run
+
+  # decomposition of the machine state to its terminals, by walking it and through its schema
+@scenario( 'hydra.decompose' )
+def hydra_decompose():
+  import hydra as h
+  import languages.heidenhain.state as machine
+  motion = machine.default()
+  def run():
+    for i in range( 200 ):
+      { type(attr) : attr.value for attr in h.breadth_first( motion ) if attr.terminal }
+    return 200
+  return run
+
+@scenario( 'hydra.schema.decompose' )
+def hydra_schema_decompose():
+  import hydra as h
+  import languages.heidenhain.state as machine
+  motion = machine.default()
+  schema = h.cached_schema( machine.Motion )
+  def run():
+    for i in range( 200 ):
+      schema.items( motion )
+    return 200
+  return run
+
+@scenario( 'hydra.solve' )
+def hydra_solve():
+  import hydra as h
+  import languages.heidenhain.state as machine
+  data = machine.StateDict()
+  def run():
+    for i in range( 50 ):
+      h.solve( machine.Motion, dict( data ), data )
+    return 50
+  return run
+
+@scenario( 'hydra.solve_graph' )
+def hydra_solve_graph():
+  import hydra as h
+  import languages.heidenhain.state as machine
+  data = machine.StateDict()
+  def run():
+    for i in range( 50 ):
+      h.solve_graph( machine.Motion, dict( data ), data )
+    return 50
+  return run
+
+  # hydra.update of the machine state with the block of a parsed line
+def update_scenario( kind, line ):
+  @scenario( 'hydra.update.' + kind )
+  def setup():
+    import languages.heidenhain.parser as hh
+    import languages.heidenhain.state as machine
+    from babel.state import Journal
+    state = Journal( line )
+    hh.Parse( state )
+    block = dict( state.symtable )
+    motion = machine.step( machine.default(), {} )
+    def run():
+      for i in range( 50 ):
+        machine.step( motion, block )
+      return 50
+    return run
+
+for kind in ( 'goto', 'incremental', 'polar', 'center' ):
+  update_scenario( kind, lines[kind] )
+
+  # parse and simulate the same line over and over, formerly start.py:do_loop
+@scenario( 'simulate.loop', unit = 'line' )
+def simulate_loop():
+  import languages.heidenhain.parser as hh
+  import languages.heidenhain.state as machine
+  from babel.state import State
+  motion = machine.step( machine.default(), {} )
+  def run():
+    current = motion
+    for i in range( 200 ):
+      state = State( 'LP IPA+20 PR30 FMAX' )
+      hh.Parse( state )
+      current = machine.step( current, state.symtable )
+    return 200
+  return run
+
+  # languages.heidenhain.batch on the 'family' program, for 10000 sets of Q parameters
+@scenario( 'batch.family', unit = 'variant' )
+def batch_family():
+  import languages.heidenhain.batch as batch
+  parameters = batch.family_parameters( 10000 )
+  ignore = lambda lineno, line, error: None
+  def run():
+    batch.Batch( parameters, ignore ).columns( batch.family )
+    return 10000
+  return run
+
+  # parse.py on a generated program of 'count' lines, from the file to the text output
+def program_scenario( name, count, repeat, slow ):
+  @scenario( 'program.' + name, unit = 'line', repeat = repeat, slow = slow )
+  def setup():
+    import parse
+    import languages.heidenhain.parser as hh
+    from languages.heidenhain.program import iter_parse_file
+    directory = tempfile.mkdtemp( prefix = 'bench' )
+    source = os.path.join( directory, 'program.H' )
+    output = os.path.join( directory, 'program.txt' )
+    programs.write( source, count )
+    def run():
+      with open( output, 'w' ) as file:
+        written = parse.write( iter_parse_file( source, hh.Parse, errors = parse.report ), file )
+      if written != count:
+        raise RuntimeError( 'Generated program parsed to %d of %d lines' % ( written, count ) )
+      return count
+    return run
+
+program_scenario( '1k',   1000,    5, False )
+program_scenario( '10k',  10000,   3, False )
+program_scenario( '100k', 100000,  1, True )
+program_scenario( '1M',   1000000, 1, True )
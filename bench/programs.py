@@ -0,0 +1,39 @@
+import random
+
+__all__ = [ 'generate', 'write' ]
+
+  # Line templates of generated programs and the random values that fill them
+def _coordinate( rng ):
+  return rng.randint( -20000, 20000 ) / 100
+
+templates = [
+  ( 'L X%+.3f Y%+.3f R0 FMAX',       lambda rng: ( _coordinate( rng ), _coordinate( rng ) ) ),
+  ( 'L X%+.3f Y%+.3f Z%+.3f R0 F%d', lambda rng: ( _coordinate( rng ), _coordinate( rng ), _coordinate( rng ), rng.randint( 50, 5000 ) ) ),
+  ( 'L IX%+.3f F%d',                 lambda rng: ( _coordinate( rng ) / 10, rng.randint( 50, 5000 ) ) ),
+  ( 'L Z%+.3f FMAX',                 lambda rng: ( _coordinate( rng ), ) ),
+  ( 'CC X%+.3f Y%+.3f',              lambda rng: ( _coordinate( rng ), _coordinate( rng ) ) ),
+  ( 'LP PR%+.3f PA%+.3f F%d',        lambda rng: ( rng.randint( 1, 5000 ) / 100, rng.randint( -17900, 17900 ) / 100, rng.randint( 50, 5000 ) ) ),
+  ( 'FN 0: Q%d = Q1*%d+%d',          lambda rng: ( rng.randint( 2, 99 ), rng.randint( 1, 9 ), rng.randint( 0, 99 ) ) ),
+  ( 'M8 M3',                         lambda rng: () ),
+]
+
+  # Yields the lines of a Heidenhain program of 'count' lines, numbered like the controller does
+  # The same 'count' and 'seed' give the same program
+def generate( count, seed = 0 ):
+  rng = random.Random( seed )
+  head = [ 'BEGIN PGM BENCH MM', 'BLK FORM 0.1 Z X+0 Y+0 Z-40', 'BLK FORM 0.2 X+100 Y+100 Z+0',
+           'TOOL CALL 5 Z S3000', 'FN 0: Q1 = 2' ]
+  for lineno in range( count - 1 ):
+    if lineno < len(head):
+      line = head[lineno]
+    else:
+      template, values = rng.choice( templates )
+      line = template % values( rng )
+    yield '%d %s' % ( lineno, line )
+  yield '%d END PGM BENCH MM' % ( count - 1 )
+
+  # Writes generate( count, seed ) to 'path'
+def write( path, count, seed = 0 ):
+  with open( path, 'w' ) as file:
+    for line in generate( count, seed ):
+      file.write( line + '\n' )
@@ -0,0 +1,99 @@
+import fnmatch
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+__all__ = [ 'Scenario', 'scenario', 'scenarios', 'select', 'run', 'compare' ]
+
+  # A named benchmark
+  # setup() prepares the data outside of the timing and returns the function to time,
+  # which returns the number of units ( lines, calls, ... ) it processed
+  # Slow scenarios only run when asked for
+class Scenario:
+  def __init__( self, name, setup, unit = 'call', repeat = 5, slow = False ):
+    self.name   = name
+    self.setup  = setup
+    self.unit   = unit
+    self.repeat = repeat
+    self.slow   = slow
+
+  def __repr__( self ):
+    return 'Scenario(%s)' % self.name
+
+    # Times the scenario, one untimed warm-up run and 'repeat' timed runs
+  def __call__( self, repeat = None ):
+    function = self.setup()
+    function()
+    times, units = [], 0
+    for i in range( self.repeat if repeat is None else repeat ):
+      start = time.perf_counter()
+      units = function()
+      times.append( time.perf_counter() - start )
+    return { 'unit' : self.unit, 'units' : units, 'times' : times,
+             'best'   : min( times ) / units,
+             'median' : statistics.median( times ) / units }
+
+  # name -> Scenario, in the order of registration
+scenarios = {}
+
+  # Registers the decorated setup function as a scenario
+def scenario( name, unit = 'call', repeat = 5, slow = False ):
+  def register( setup ):
+    if name in scenarios:
+      raise RuntimeError( 'Scenario "' + name + '" already defined' )
+    scenarios[name] = Scenario( name, setup, unit, repeat, slow )
+    return setup
+  return register
+
+  # Scenarios whose name matches any of the shell-style 'patterns', all if there are none
+def select( patterns = (), slow = False ):
+  import bench.catalog
+  return [ value for name, value in scenarios.items()
+             if ( slow or not value.slow ) and ( not patterns or any( fnmatch.fnmatchcase( name, pattern ) for pattern in patterns ) ) ]
+
+  # Runs the scenarios and returns the results, ready for json.dump
+def run( selected, repeat = None, log = print ):
+  results = {}
+  for value in selected:
+    result = results[value.name] = value( repeat )
+    if log is not None:
+      log( '%-28s %12.2f us/%s (median %.2f)' % ( value.name, result['best'] * 1e6, value.unit, result['median'] * 1e6 ) )
+  return { 'version' : 1, 'meta' : meta(), 'results' : results }
+
+  # Description of the machine and the tree the results were measured on
+def meta():
+  try:
+    commit = subprocess.run( [ 'git', 'rev-parse', 'HEAD' ], cwd = os.path.dirname( os.path.abspath( __file__ ) ),
+               stdout = subprocess.PIPE, stderr = subprocess.DEVNULL, universal_newlines = True ).stdout.strip()
+  except OSError:
+    commit = ''
+  return { 'python'   : sys.version.split()[0],
+           'platform' : platform.platform(),
+           'machine'  : platform.machine(),
+           'cpus'     : os.cpu_count(),
+           'commit'   : commit,
+           'time'     : time.strftime( '%Y-%m-%dT%H:%M:%S' ) }
+
+  # Compares the scenarios present in both results by their 'stat' time per unit
+  # Returns ( name, old, new, new / old, regressed ) rows, a scenario regressed
+  # if it is slower by more than 'threshold' (0.1 is 10%)
+def compare( old, new, threshold = 0.1, stat = 'best' ):
+  rows = []
+  for name, result in new['results'].items():
+    if name in old['results']:
+      before, after = old['results'][name][stat], result[stat]
+      ratio = after / before
+      rows.append( ( name, before, after, ratio, ratio > 1 + threshold ) )
+  return rows
+
+def load( path ):
+  with open( path ) as file:
+    return json.load( file )
+
+def save( results, path ):
+  with open( path, 'w' ) as file:
+    json.dump( results, file, indent = 1 )
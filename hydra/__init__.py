@@ -6,10 +6,17 @@ from hydra.classes import AttributesMeta
 from hydra.classes import morphism
 
 from hydra.functions import update
+from hydra.functions import update_dirty
+from hydra.functions import update_retry
 from hydra.functions import solve
+from hydra.functions import solve_graph
+from hydra.functions import check_solve
 from hydra.functions import morph
 from hydra.functions import construct
 
+from hydra.schema import Schema
+from hydra.schema import cached_schema
+
 from hydra.iteration import in_order
 from hydra.iteration import in_order_cached
 from hydra.iteration import post_order
@@ -1,3 +1,4 @@
+import copyreg
 import enum
 from math import isclose
 
@@ -44,6 +45,12 @@ class AttributeMeta(type):
   def __repr__( self ):
     return '%s.%s' % (self.instance, self.name)    
 
+# Attribute classes are created per Morph, pickle them as a lookup on their Morph
+def attribute( instance, name ):
+  return getattr( instance.attr, name )
+
+copyreg.pickle( AttributeMeta, lambda attr: ( attribute, ( attr.instance, attr.name ) ) )
+
 class Attributes:
   def __init__( self, instance ):
     self._attributes_ = []
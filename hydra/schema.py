@@ -0,0 +1,46 @@
+from operator import attrgetter
+
+''' Flat layout of a Morph hierarchy: every terminal of cls has a fixed slot
+    Terminals are the keys of the decompositions of hydra ( Point.X.attr.abs, ... ), in the order
+    of breadth_first(cls). A Morph class used at more than one place ( Plane in Cartesian and Polar )
+    has the same terminals, so the same slots, at each of them.
+    The schema only reads Morph instances, through the attribute paths of its slots, so decomposing
+    one does not walk it. Morph instances and their construction are unchanged: solve, morph and
+    the morphisms work on them, and construct still builds them from a decomposition.
+'''
+class Schema:
+  def __init__( self, cls ):
+    self.cls = cls
+    paths = {}   # terminal -> attribute path from cls, the last one in breadth_first order
+    level = [ (attr, attr.name) for attr in cls.attr ]
+    while len(level) > 0:
+      for attr, path in level:
+        if attr.terminal:
+          paths[attr] = path
+      level = [ (member, path + '.' + member.name) for attr, path in level if not attr.terminal
+                                                      for member in attr.value.attr ]
+    self.keys  = list(paths)
+    self.slots = { key : slot for slot, key in enumerate(self.keys) }
+    self._get  = attrgetter( *paths.values() ) if len(paths) > 0 else lambda value: ()
+
+  def __len__( self ):
+    return len(self.keys)
+
+  # terminal values of value, a Morph instance of cls, in slot order
+  def decompose( self, value ):
+    values = self._get(value)
+    return list(values) if len(self.keys) != 1 else [ values ]
+
+  # decomposition of value as a dict, { terminal : value }, as hydra.update makes it
+  def items( self, value ):
+    return dict( zip( self.keys, self.decompose(value) ) )
+
+_schemas_ = {}
+
+''' Schema of the Morph class cls, compiled once '''
+def cached_schema( cls ):
+  try:
+    return _schemas_[cls]
+  except KeyError:
+    _schemas_[cls] = Schema(cls)
+    return _schemas_[cls]
@@ -0,0 +1,125 @@
+import languages.expression.commands as cmd
+from babel.terminal import Push
+
+__all__ = [ 'Compiled', 'lower', 'compile_text' ]
+
+  # Expressions lowered to Python functions
+  # The commands of an expression (see languages.expression.pratt) are turned into a tree,
+  # constant subtrees are folded and the rest becomes one function of the symtable:
+  #   Q5 = Q1*2+Q2   ->   let( symtable, 'Q5', symtable['Q1'] * c0 + symtable['Q2'] )
+  # The function is executed by a single Compiled command, an expression without variables
+  # by a single Push of its value. Both replace the commands of the stack machine, with the
+  # same results, errors and order of reads and assignments.
+  # Lowered expressions are cached by their text, at most 'size' of them.
+
+size = 4096
+_cache = {}   # text -> command
+
+symbols = { cmd.ADD : '+', cmd.SUB : '-', cmd.MUL : '*', cmd.DIV : '/', cmd.POW : '**' }
+
+operations = {
+  cmd.ADD : lambda a, b: a + b,
+  cmd.SUB : lambda a, b: a - b,
+  cmd.MUL : lambda a, b: a * b,
+  cmd.DIV : lambda a, b: a / b,
+  cmd.POW : lambda a, b: a ** b
+}
+
+  # Command that evaluates a lowered expression and pushes its value
+  # 'reads' are the variables it reads, 'text' the expression it was lowered from
+class Compiled:
+  __slots__ = 'text', 'function', 'reads'
+  def __init__( self, text, function, reads ):
+    self.text     = text
+    self.function = function
+    self.reads    = reads
+
+  def __call__( self, state ):
+    state.stack.append( self.function( state.symtable ) )
+
+  def __repr__( self ):
+    return '<Compiled ' + self.text + '>'
+
+    # functions do not pickle, the text is lowered again
+  def __reduce__( self ):
+    return compile_text, ( self.text, )
+
+def let( symtable, name, value ):
+  symtable[name] = value
+  return value
+
+  # Command of the expression 'text' with the given stack machine commands
+def lower( text, commands ):
+  try:
+    return _cache[text]
+  except KeyError:
+    pass
+  tree = fold( build( commands ) )
+  if tree[0] == 'value':
+    command = Push( tree[1] )
+  else:
+    constants, reads = [], set()
+    source = generate( tree, constants, reads )
+    namespace = { 'let' : let }
+    namespace.update( ( 'c%d' % index, value ) for index, value in enumerate( constants ) )
+    exec( 'def _expression( symtable ):\n'
+          '  try:\n'
+          '    return ' + source + '\n'
+          '  except KeyError as error:\n'
+          '    raise RuntimeError( "Unknown variable : " + str( error.args[0] ) )\n', namespace )
+    command = Compiled( text, namespace['_expression'], frozenset( reads ) )
+  if len(_cache) >= size:
+    _cache.clear()
+  _cache[text] = command
+  return command
+
+  # Command of the expression 'text', parsed again
+def compile_text( text ):
+  import languages.expression.pratt as pratt
+  commands = []
+  pratt.Climber( text, len(text), commands ).climb( 0, 0 )
+  return lower( text, commands )
+
+  # Tree of an expression from its commands, executed on a stack of nodes:
+  #   ( 'value', value ), ( 'get', name ), ( 'let', name, node ), ( 'op', command, left, right )
+def build( commands ):
+  stack = []
+  for command in commands:
+    if type(command) is Push:
+      stack.append( ( 'value', command.value ) )
+    elif command is cmd.GET:
+      stack.append( ( 'get', stack.pop()[1] ) )
+    elif command is cmd.LET:
+      value = stack.pop()
+      stack.append( ( 'let', stack.pop()[1], value ) )
+    else:
+      right = stack.pop()
+      stack.append( ( 'op', command, stack.pop(), right ) )
+  return stack.pop()
+
+  # Evaluates the operations of constants, except those that fail - they fail when executed
+def fold( node ):
+  if node[0] == 'let':
+    return ( 'let', node[1], fold( node[2] ) )
+  if node[0] != 'op':
+    return node
+  left, right = fold( node[2] ), fold( node[3] )
+  if left[0] == 'value' and right[0] == 'value':
+    try:
+      return ( 'value', operations[node[1]]( left[1], right[1] ) )
+    except ( ArithmeticError, TypeError, ValueError ):
+      pass
+  return ( 'op', node[1], left, right )
+
+  # Python expression of a tree, constants are named c0, c1, ...
+def generate( node, constants, reads ):
+  kind = node[0]
+  if kind == 'value':
+    constants.append( node[1] )
+    return 'c%d' % ( len(constants) - 1 )
+  if kind == 'get':
+    reads.add( node[1] )
+    return 'symtable[%r]' % node[1]
+  if kind == 'let':
+    return 'let( symtable, %r, %s )' % ( node[1], generate( node[2], constants, reads ) )
+  return '(%s %s %s)' % ( generate( node[2], constants, reads ), symbols[node[1]], generate( node[3], constants, reads ) )
@@ -2,41 +2,35 @@ import  re
 
 # import  languages.expression.grammar  as grammar
 import  languages.expression.commands as cmd
+import  languages.expression.pratt    as pratt
 
 from babel.terminal import *
 import  babel.rule      as r
 import  babel.compiler  as c
 
-import babel.lang.parser as p
+import  babel.cache     as cache
+import  os
 
-with open( 'languages/expression/expression.lang' ) as file:
-  lang = p.parseStr( file.read() )
-  globals().update( lang.symtable )
+  # Version of the terminal table below, part of the grammar cache key
+VERSION = 1
+
+symtable = cache.load( os.path.join( os.path.dirname( __file__ ), 'expression.lang' ), VERSION )
+globals().update( symtable )
 
 p = re.compile
 
 number_pattern = p('([+-]?((\\d+[.]\\d*)|([.]\\d+)|(\\d+)))')
 identifier_pattern = p('(([a-zA-Z_]+\\d*)+)')
 
-def number( state ):
-  match = number_pattern.match( state.input )
-  if match is not None:
-    state.input = match.string[match.end(0):]
-    return (Push(float(match.groups()[0])),)
-  
-  raise ParserFailedException('Number not matched')
+def make_number( match ):
+  return (Push(float(match.groups()[0])),)
 
-def identifier( state ):
-  match = identifier_pattern.match( state.input )
-  if match is not None:
-    state.input = match.string[match.end(0):]
-    return (Push(match.groups()[0]),)
-  
-  raise ParserFailedException('Identifier not matched')
+def make_identifier( match ):
+  return (Push(match.groups()[0]),)
     
 terminals = {
-  'number'      : number,
-  'identifier'  : identifier,
+  'number'      : If(number_pattern, make_number),
+  'identifier'  : If(identifier_pattern, make_identifier),
   'GET'         : Return(cmd.GET),
   
   'assign'      : Return(cmd.LET).If(p('[=]')),
@@ -45,11 +39,113 @@ terminals = {
   
   'plusminus'   : Lookup( {p('[+]') : (cmd.ADD,), p('[-]') : (cmd.SUB,)}.items() ),
   'muldiv'      : Lookup( {p('[*]') : (cmd.MUL,), p('[/]') : (cmd.DIV,)}.items() ),
-  'power'       : If(p('\\^'), Return(cmd.POW))
+  'power'       : If(p('\\^'), Return(cmd.POW)),
+
+    # precedence-climbing parsers of the whole language, see build()
+  'climb_expression'    : pratt.Expression(),
+  'climb_primary'       : pratt.Expression( primary = True ),
+  'compiled_expression' : pratt.Expression( compiled = True ),
+  'compiled_primary'    : pratt.Expression( primary = True, compiled = True )
 }
 
-compiler = c.Reordering( terminals )
+  # Rules of the 'expression' and 'primary' entry points
+  # They run the precedence-climbing parser of languages.expression.pratt
+entries = ( r.Push( r.Terminal('climb_expression') ), r.Push( r.Terminal('climb_primary') ) )
+
+  # Entry points that lower each expression to one cached command (see languages.expression.compiled)
+compiled_entries = ( r.Push( r.Terminal('compiled_expression') ), r.Push( r.Terminal('compiled_primary') ) )
+
+  # Compiles the 'expression' and 'primary' entry points with the given compiler
+  # build_grammar compiles the rules of expression.lang instead, 'rules' as loaded by babel.cache
+  # ( optimized by default )
+def build( compiler, compiled = False ):
+  return tuple( rule.compile( compiler ) for rule in ( compiled_entries if compiled else entries ) )
+
+def build_grammar( compiler, rules = symtable ):
+  return rules['expression'].compile( compiler ), rules['primary'].compile( compiler )
+
+compiler = c.Sentinel( terminals )
+
+Parse, primary = build( compiler )
+number  = r.Terminal('number').compile( compiler )
+  # Expressions of the benchmarks, with the variables they read
+sample = [ '+12.5', 'Q1*2+Q2', '(Q1+3)*(Q2-1)/2^2', 'Q5=Q1*2+3', '-4', 'Q1' ]
+variables = { 'Q1' : 1.0, 'Q2' : 2.0 }
+
+  # Expressions per second of the rules of expression.lang and of the precedence-climbing
+  # parser, with the compiler 'Compiler', checking that they leave the same stack and symtable
+def bench_climb( n = 2000, expressions = sample, Compiler = c.Sentinel ):
+  import time
+  from babel.state import Journal
+  reference = {}
+  for name, parsers in ( ( 'grammar', build_grammar( Compiler( terminals ) ) ), ( 'climb', build( Compiler( terminals ) ) ) ):
+    for entry, parser in zip( ( 'expression', 'primary' ), parsers ):
+      results = []
+      start = time.time()
+      for i in range(n):
+        for text in expressions:
+          state = Journal( text )
+          state.symtable.update( variables )
+          parser( state )
+          if i == 0:
+            results.append( ( state.pos, list( state.stack ), dict( state.symtable ) ) )
+      elapsed = time.time() - start
+      reference.setdefault( entry, results )
+      print( '%s %s: %.0f expressions/s, identical: %s' % ( name, entry, n * len(expressions) / elapsed, results == reference[entry] ) )
+
+  # Time to execute the parsed commands of 'text' 'n' times, as the stack machine commands
+  # and lowered by languages.expression.compiled
+def bench_compiled( n = 100000, text = 'Q5 = Q1*2+Q2' ):
+  import time
+  from babel.state import Cursor
+  for compiled in ( False, True ):
+    commands = terminals[ 'compiled_expression' if compiled else 'climb_expression' ]( Cursor( text ) )
+    state = Cursor( text )
+    state.symtable.update( variables )
+    start = time.time()
+    for i in range(n):
+      for f in commands:
+        f( state )
+      del state.stack[:]
+    print( '%s: %d commands, %.2f us per execution' % ( 'compiled' if compiled else 'stack', len(commands), ( time.time() - start ) * 1e6 / n ) )
+
+  # Pieces of the random expressions of bench_optimizer, valid or not
+pieces = [ '1', '2.5', '.5', '+3', '-4', 'Q1', 'Q2', 'Q9', 'Q5=', '(', ')', '+', '-', '*', '/', '^', ' ', '=', 'x', 'Q1=2', '7.', '0' ]
+
+  # Yields 'count' random expressions of 1 to 9 pieces, the same for the same 'seed'
+def generate( count, seed = 0 ):
+  import random
+  rng = random.Random( seed )
+  for i in range( count ):
+    yield ''.join( rng.choice( pieces ) for j in range( rng.randint( 1, 9 ) ) )
+
+  # Parses each text with 'parser' on a journal with the variables of the benchmarks, returns for
+  # each text the position, stack and symtable, or the error - of the parser or of a command
+def outcomes( parser, texts ):
+  from babel.state import Journal
+  result = []
+  for text in texts:
+    state = Journal( text )
+    state.symtable.update( variables )
+    try:
+      parser( state )
+      result.append( ( state.pos, repr( state.stack ), repr( state.symtable ) ) )
+    except ( RuntimeError, ParserFailedException, ArithmeticError ) as error:
+      result.append( repr( error ) )
+  return result
 
-Parse   = expression.compile( compiler )
-primary = primary.compile( compiler )
-number  = r.Terminal('number').compile( compiler )
\ No newline at end of file
+  # Parses 'count' random expressions and the sample with the rules of expression.lang as read and as
+  # rewritten by babel.optimizer, with each compiler, and checks that both give the same outcomes
+def bench_optimizer( count = 20000, seed = 0, compilers = ( c.Reordering, c.Memoizing, c.Lookahead, c.Sentinel ) ):
+  import time
+  plain = cache.load( os.path.join( os.path.dirname( __file__ ), 'expression.lang' ), VERSION, optimize = False )
+  texts = sample + list( generate( count, seed ) )
+  for Compiler in compilers:
+    for entry, old, new in zip( ( 'expression', 'primary' ), build_grammar( Compiler( terminals ), plain ), build_grammar( Compiler( terminals ) ) ):
+      timings = []
+      for parser in ( old, new ):
+        start = time.time()
+        timings.append( outcomes( parser, texts ) )
+        timings.append( ( time.time() - start ) * 1e6 / len(texts) )
+      print( '%s %s: %.2f us/expression, optimized %.2f us/expression, identical: %s' %
+        ( Compiler.__name__, entry, timings[1], timings[3], timings[0] == timings[2] ) )
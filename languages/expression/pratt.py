@@ -0,0 +1,134 @@
+import re
+
+import languages.expression.commands as cmd
+import languages.expression.compiled as lowering
+from babel.terminal import TerminalBase
+from babel.terminal import ParserFailedException
+from babel.terminal import FAIL
+from babel.terminal import Push
+
+__all__ = [ 'Expression' ]
+
+p = re.compile
+
+number_pattern     = p('([+-]?((\\d+[.]\\d*)|([.]\\d+)|(\\d+)))')
+identifier_pattern = p('(([a-zA-Z_]+\\d*)+)')
+
+  # binary operator -> ( command, binding power, right associative )
+operators = {
+  '+' : ( cmd.ADD, 1, False ),
+  '-' : ( cmd.SUB, 1, False ),
+  '*' : ( cmd.MUL, 2, False ),
+  '/' : ( cmd.DIV, 2, False ),
+  '^' : ( cmd.POW, 3, True  )
+}
+
+  # Precedence-climbing parser of expression.lang
+  # A terminal that returns the commands of the expression in postfix order - the order
+  # in which the grammar executes them - so Push( Terminal ) of it behaves as the compiled
+  # 'expression' rule, or the 'primary' rule with 'primary' set, for every compiler.
+  # Like the grammar, an operator whose right operand does not parse ends the expression
+  # before the operator, and an assignment whose expression does not parse is read as a variable.
+  # Unknown variables raise when the commands are executed, after the expression parsed.
+  # With 'compiled' set, the commands of an expression that has more than one are lowered
+  # to a single command by languages.expression.compiled
+  # Numbers and identifiers are matched by the 'match' functions of their patterns, lexed()
+  # matches them through the tokens of a babel.lexer.Lexer
+class Expression( TerminalBase ):
+  first = ( number_pattern, identifier_pattern, p('[(]') )
+
+  def __init__( self, primary = False, compiled = False ):
+    self.primary  = primary
+    self.compiled = compiled
+    self.number     = number_pattern.match
+    self.identifier = identifier_pattern.match
+
+  def lexed( self, lexer ):
+    result = Expression( self.primary, self.compiled )
+    result.number     = lexer.matcher( number_pattern )
+    result.identifier = lexer.matcher( identifier_pattern )
+    return result
+
+  def __call__( self, state ):
+    result = self.attempt( state )
+    if result is FAIL:
+      raise ParserFailedException('Expression did not match')
+    return result
+
+  def attempt( self, state ):
+    out = []
+    parser = Climber( state.buffer, min( state.end, len(state.buffer) ), out, self.number, self.identifier )
+    pos = parser.operand( state.pos ) if self.primary else parser.climb( state.pos, 0 )
+    if pos < 0:
+      return FAIL
+    if self.compiled and len(out) > 1:
+      out = ( lowering.lower( state.buffer[state.pos:pos].rstrip(' '), out ), )
+    state.advance( pos )
+    return tuple( out )
+
+  # Parses one expression of a buffer, appending its commands to 'out'
+  # Parsing methods return the position after the parsed input, with spaces skipped, or -1
+class Climber:
+  __slots__ = 'buffer', 'end', 'out', 'number', 'identifier'
+  def __init__( self, buffer, end, out, number = number_pattern.match, identifier = identifier_pattern.match ):
+    self.buffer     = buffer
+    self.end        = end
+    self.out        = out
+    self.number     = number
+    self.identifier = identifier
+
+  def skip( self, pos ):
+    buffer, end = self.buffer, self.end
+    while pos < end and buffer[pos] == ' ':
+      pos += 1
+    return pos
+
+    # operand, followed by the operators binding at least 'minimum'
+  def climb( self, pos, minimum ):
+    pos = self.operand( pos )
+    if pos < 0:
+      return -1
+    buffer, end, out = self.buffer, self.end, self.out
+    while pos < end:
+      operator = operators.get( buffer[pos] )
+      if operator is None or operator[1] < minimum:
+        break
+      command, power, right = operator
+      mark = len(out)
+      after = self.climb( self.skip( pos + 1 ), power if right else power + 1 )
+      if after < 0:
+        del out[mark:]
+        break
+      out.append( command )
+      pos = after
+    return pos
+
+    # number / identifier '=' expression / identifier / '(' expression ')'
+  def operand( self, pos ):
+    buffer, end, out = self.buffer, self.end, self.out
+    match = self.number( buffer, pos, end )
+    if match is not None:
+      out.append( Push( float( match.group(1) ) ) )
+      return self.skip( match.end() )
+    match = self.identifier( buffer, pos, end )
+    if match is not None:
+      name = match.group(1)
+      pos = self.skip( match.end() )
+      if pos < end and buffer[pos] == '=':
+        mark = len(out)
+        out.append( Push( name ) )
+        after = self.climb( self.skip( pos + 1 ), 0 )
+        if after >= 0:
+          out.append( cmd.LET )
+          return after
+        del out[mark:]
+      out.append( Push( name ) )
+      out.append( cmd.GET )
+      return pos
+    if pos < end and buffer[pos] == '(':
+      mark = len(out)
+      after = self.climb( self.skip( pos + 1 ), 0 )
+      if after >= 0 and after < end and buffer[after] == ')':
+        return self.skip( after + 1 )
+      del out[mark:]
+    return -1
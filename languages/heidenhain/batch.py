@@ -0,0 +1,223 @@
+import numpy as np
+
+import babel
+import babel.compiler as c
+import languages.heidenhain.parser as hh
+import languages.expression.commands as expression
+from babel.state import Cursor
+from babel.state import Recorder
+
+__all__ = [ 'Batch' ]
+
+  # Parametric NC program evaluated for many sets of Q parameters at once
+  # 'parameters' maps each Q parameter to its values, one per variant, or to a single
+  # value shared by all variants. Every line is parsed once, with a compiler.Recording
+  # parser, into the stack machine commands of its expressions and the heidenhain commands
+  # (see program.record). The effects are executed once per line on a symtable of NumPy
+  # arrays, a column of one value per variant, so every variant is evaluated in one pass.
+  # Errors that depend on the values - division by zero, zero or a negative number raised
+  # to a negative or fractional power, overflow - fail only the variants they happen in:
+  # errors[variant] = ( lineno, exception ) records the first one of each variant, 'failed'
+  # marks them, and their values from that line on are not meaningful (NaN where it failed).
+  # Errors that do not depend on the values fail the line for every variant, as in iter_parse:
+  # the line is passed to errors( lineno, line, exception ) and skipped, without 'errors'
+  # the exception is raised. Those are lines that do not parse, unknown variables, ...
+class Batch:
+  def __init__( self, parameters, errors = None ):
+    self.symtable = {}   # carried from line to line, as in iter_parse
+    self.size = 1
+    for name, values in parameters.items():
+      values = np.asarray( values, np.float64 )
+      if values.ndim > 1:
+        raise ValueError( 'Values of ' + name + ' are not one value per variant' )
+      if values.ndim == 1:
+        if self.size > 1 and len(values) != self.size:
+          raise ValueError( 'Values of ' + name + ' are not one per variant, %d variants' % self.size )
+        self.size = len(values)
+        self.symtable[name] = values
+      else:
+        self.symtable[name] = float( values )
+    self.failed = np.zeros( self.size, np.bool_ )
+    self.errors = {}     # variant -> ( lineno, exception )
+    self.report = errors
+    self.lineno = None
+
+    # Yields ( line number, symtable ) for every evaluated line, like iter_parse
+    # Values of the symtable are arrays of one value per variant, or single values shared by all
+  def evaluate( self, lines, start = 1 ):
+    lines = list( lines )
+    for lineno, line, effects in zip( range( start, start + len(lines) ), lines, record( lines ) ):
+      line = line.rstrip('\n')
+      self.lineno = lineno
+      state = Cursor( line )
+      state.symtable.update( self.symtable )
+      try:
+        if effects is None:
+          raise RuntimeError( 'Parser failed at line ' + line )
+        for f in effects:
+          vectorized.get( f, _execute )( f, state, self )
+      except ( RuntimeError, babel.ParserFailedException ) as error:
+        if self.report is None:
+          raise
+        self.report( lineno, line, error )
+        continue
+      self.symtable.update( state.symtable )
+      yield lineno, state.symtable
+
+    # Evaluates the lines and returns ( line numbers, columns ), for each key of 'keys' a
+    # variants x lines array of its values, NaN where a line has no value for it
+    # or after the variant failed. Without 'keys', all keys with numeric values.
+  def columns( self, lines, keys = None, start = 1 ):
+    linenos, rows = [], []
+    for lineno, symtable in self.evaluate( lines, start ):
+      linenos.append( lineno )
+      rows.append( symtable )
+    if keys is None:
+      keys = []
+      for symtable in rows:
+        keys.extend( key for key, value in symtable.items() if key not in keys and numeric( value ) )
+    linenos = np.array( linenos, np.int64 )
+    columns = {}
+    for key in keys:
+      column = np.full( ( self.size, len(rows) ), np.nan )
+      for index, symtable in enumerate( rows ):
+        if key in symtable and numeric( symtable[key] ):
+          column[:, index] = symtable[key]
+      columns[key] = column
+    failed = np.full( self.size, np.iinfo( np.int64 ).max )
+    for variant, ( lineno, error ) in self.errors.items():
+      failed[variant] = lineno
+    after = linenos[np.newaxis, :] >= failed[:, np.newaxis]
+    for column in columns.values():
+      column[after] = np.nan
+    return linenos, columns
+
+    # Fails the variants where 'mask' is set, and that did not fail yet, with 'error'
+  def fail( self, mask, error ):
+    mask = np.broadcast_to( mask, ( self.size, ) ) & ~self.failed
+    for variant in np.flatnonzero( mask ):
+      self.errors[int( variant )] = ( self.lineno, error )
+    self.failed |= mask
+
+def numeric( value ):
+  return isinstance( value, ( int, float, np.ndarray ) ) and not isinstance( value, bool )
+
+  # Effects of each line, parsed without executing them
+def record( lines ):
+  global _recording
+  if _recording is None:
+    _recording = hh.build( c.Recording, compiled = False )
+  records = []
+  for line in lines:
+    state = Recorder( line.rstrip('\n') )
+    try:
+      _recording( state )
+    except ( RuntimeError, babel.ParserFailedException ):
+      records.append( None )
+      continue
+    records.append( tuple( state.effects ) if state.remaining == 0 else None )
+  return records
+
+_recording = None
+
+def _execute( f, state, batch ):
+  f( state )
+
+  # Stack machine commands whose errors depend on the values, executed on arrays
+  # The variants where an operation fails get NaN, the others the value of the operation
+def _divide( f, state, batch ):
+  A, B = state.stack[-2:]
+  del state.stack[-2:]
+  zero = np.equal( B, 0 )
+  with np.errstate( all = 'ignore' ):
+    result = np.divide( A, B )
+  if np.any( zero ):
+    batch.fail( zero, ZeroDivisionError( 'float division by zero' ) )
+    result = np.where( zero, np.nan, result )
+  state.stack.append( result )
+
+def _power( f, state, batch ):
+  A, B = state.stack[-2:]
+  del state.stack[-2:]
+  with np.errstate( all = 'ignore' ):
+    result = np.power( np.asarray( A, np.float64 ), B )
+    zero     = np.equal( A, 0 ) & np.less( B, 0 )
+    complex_ = np.less( A, 0 ) & np.not_equal( B, np.floor( B ) )
+    overflow = np.isinf( result ) & np.isfinite( A ) & np.isfinite( B ) & ~zero
+  bad = zero | complex_ | overflow
+  if np.any( bad ):
+    batch.fail( zero, ZeroDivisionError( '0.0 cannot be raised to a negative power' ) )
+      # Python gives a complex number, the coordinates of a program are real
+    batch.fail( complex_, ValueError( 'negative number cannot be raised to a fractional power' ) )
+    batch.fail( overflow, OverflowError( 'Numerical result out of range' ) )
+    result = np.where( bad, np.nan, result )
+  state.stack.append( result )
+
+vectorized = {
+  expression.DIV : _divide,
+  expression.POW : _power
+}
+
+  # Parametric program of the benchmarks, with an error in some variants and in every one
+family = [
+  'BEGIN PGM FAMILY MM',
+  'FN 0: Q10 = Q1 / 2',
+  'FN 0: Q11 = Q2 / Q3',
+  'L X(Q10) Y(Q11) R0 FMAX',
+  'L Z(0-Q4) F(Q5*100)',
+  'CC X(Q10) Y(Q11)',
+  'C X(Q10+Q1^0.5) Y(Q11) DR+',
+  'L X(Q10*Q3^Q4) Y(Q1-Q2) Z(Q4/(Q3-1))',
+  'L Z(Q99)',
+  'END PGM FAMILY MM'
+]
+
+  # Random Q parameters of 'family' for 'count' variants
+def family_parameters( count, seed = 0 ):
+  random = np.random.RandomState( seed )
+  return {
+    'Q1' : random.uniform( -10, 100, count ).round( 1 ),
+    'Q2' : random.uniform( 0, 50, count ).round( 1 ),
+    'Q3' : random.randint( 0, 4, count ).astype( np.float64 ),
+    'Q4' : random.uniform( 1, 5, count ).round( 2 ),
+    'Q5' : 2.5
+  }
+
+  # Times the evaluation of 'family' for 'count' variants in one Batch against
+  # iter_parse once per variant, and checks that both give the same values and errors
+def bench_batch( count = 1000, variants = None ):
+  import time
+  import languages.heidenhain.program as program
+  parameters = family_parameters( count )
+  errors = {}
+  start = time.time()
+  batch = Batch( parameters, errors = lambda lineno, line, error: errors.setdefault( lineno, str(error) ) )
+  linenos, columns = batch.columns( family )
+  elapsed = time.time() - start
+  print( 'batch: %.3fs, %d variants, %d failed' % ( elapsed, count, len(batch.errors) ) )
+
+  identical = True
+  parser = hh.build( compiled = False )
+  start = time.time()
+  for variant in range( count if variants is None else variants ):
+    symtable = { name : float( np.broadcast_to( values, ( count, ) )[variant] ) for name, values in parameters.items() }
+    serial = {}
+    try:
+      for lineno, block in program.iter_parse( family, parser, symtable, errors = lambda *args: None ):
+        serial[lineno] = block
+        if any( isinstance( value, complex ) for value in block.values() ):
+          raise ValueError( 'complex result' )
+      error = None
+    except ( ArithmeticError, ValueError ) as exception:
+      error = exception
+    if ( error is None ) != ( variant not in batch.errors ) or error is not None and type(error) is not type(batch.errors[variant][1]):
+      identical = False
+    for index, lineno in enumerate( linenos ):
+      if variant in batch.errors and lineno >= batch.errors[variant][0]:
+        break
+      for key, column in columns.items():
+        value = serial.get( lineno, {} ).get( key )
+        if value is None and not np.isnan( column[variant, index] ) or value is not None and not np.isclose( value, column[variant, index] ):
+          identical = False
+  elapsed = time.time() - start
+  print( 'serial: %.3fs for %d variants, identical: %s, line errors: %s' % ( elapsed, count if variants is None else variants, identical, errors ) )
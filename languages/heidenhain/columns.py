@@ -0,0 +1,207 @@
+import enum
+import importlib
+import json
+import os
+
+import numpy as np
+
+from hydra.classes import AttributeMeta
+from babel.terminal import Push
+
+__all__ = [ 'Writer', 'Table', 'write', 'path', 'resolve' ]
+
+  # Columnar on-disk format for parse results ( line number, symtable )
+  # A result is a directory:
+  #   header.json  - row count and the columns: symtable key path, kind, enum class, files
+  #   lineno.i8    - line numbers, int64
+  #   <n>.f8       - values of column n, float64, one per row (0 where absent)
+  #   <n>.bits     - presence bitmap of column n, numpy.packbits of one bit per row
+  # Enum values are stored as their value and decoded with the enum class from the header.
+  # Columns are added as keys appear, earlier rows are marked absent.
+  # Everything but the header is raw arrays, so Table opens them with numpy.memmap.
+
+  # Path of a symtable key:
+  #   Morph attribute  'languages.heidenhain.state:Point.X.abs'
+  #   enum member      'languages.heidenhain.state:Registers.LINENO'
+  #   name             'Q1'
+def path( key ):
+  if isinstance( key, AttributeMeta ):
+    return '%s:%s.%s' % ( key.instance.__module__, key.instance.__qualname__, key.name )
+  if isinstance( key, enum.Enum ):
+    return '%s:%s.%s' % ( type(key).__module__, type(key).__qualname__, key.name )
+  if isinstance( key, str ):
+    return key
+  raise TypeError( 'Unsupported symtable key: ' + repr(key) )
+
+  # Object of a path, the inverse of path() for keys of the given kind
+def resolve( key_path, kind = 'name' ):
+  if ':' not in key_path:
+    return key_path
+  module, names = key_path.split( ':' )
+  names = names.split( '.' )
+  target = importlib.import_module( module )
+  for name in names[:-1]:
+    target = getattr( target, name )
+  if kind == 'attribute':
+    return getattr( target.attr, names[-1] )
+  return getattr( target, names[-1] )
+
+def kind( key ):
+  if isinstance( key, AttributeMeta ):
+    return 'attribute'
+  if isinstance( key, enum.Enum ):
+    return 'enum'
+  return 'name'
+
+  # float value of a symtable value
+def convert( value ):
+  if isinstance( value, Push ):
+    value = value.value
+  if isinstance( value, enum.Enum ):
+    value = value.value
+  return float( value )
+
+class Writer:
+    # 'block' rows are kept in memory between flushes, a multiple of 8 keeps the bitmaps aligned
+  def __init__( self, directory, block = 4096 ):
+    if block % 8 != 0:
+      raise ValueError( 'block has to be a multiple of 8' )
+    os.makedirs( directory, exist_ok = True )
+    self.directory = directory
+    self.block   = block
+    self.rows    = 0      # rows written to the files
+    self.columns = {}     # key -> column index
+    self.header  = []     # column descriptions
+    self._layouts = {}    # tuple of keys -> column indices
+    self._linenos = []
+    self._buffer  = []    # per buffered row: ( column indices, values )
+    open( os.path.join( directory, 'lineno.i8' ), 'wb' ).close()
+
+  def __enter__( self ):
+    return self
+
+  def __exit__( self, *args ):
+    self.close()
+
+    # Consecutive symtables mostly share their keys, in the same order,
+    # so rows are buffered as values and converted per layout of keys at once
+  def append( self, lineno, symtable ):
+    keys = tuple( symtable )
+    try:
+      layout = self._layouts[keys]
+    except KeyError:
+      layout = self._layouts[keys] = tuple( self.columns[key] if key in self.columns else self.add( key ) 
+                                              for key in keys )
+    self._linenos.append( lineno )
+    self._buffer.append( ( layout, tuple( symtable.values() ) ) )
+    if len(self._buffer) >= self.block:
+      self.flush()
+
+  def add( self, key ):
+    column = len(self.header)
+    self.columns[key] = column
+    self.header.append( { 'key' : path( key ), 'kind' : kind( key ), 'enum' : None,
+                          'values' : '%d.f8' % column, 'present' : '%d.bits' % column } )
+      # rows written before the column appeared are absent
+    with open( self.file( column, 'values' ), 'wb' ) as file:
+      np.zeros( self.rows, np.float64 ).tofile( file )
+    with open( self.file( column, 'present' ), 'wb' ) as file:
+      np.zeros( self.rows // 8, np.uint8 ).tofile( file )
+    return column
+
+  def file( self, column, name ):
+    return os.path.join( self.directory, self.header[column][name] )
+
+  def flush( self ):
+    count = len(self._buffer)
+    if count == 0:
+      return
+    groups = {}   # layout -> ( rows, values )
+    for row, ( layout, cells ) in enumerate( self._buffer ):
+      group = groups.get( layout )
+      if group is None:
+        group = groups[layout] = ( [], [] )
+      group[0].append( row )
+      group[1].append( cells )
+    values  = np.zeros( ( len(self.header), count ), np.float64 )
+    present = np.zeros( ( len(self.header), count ), np.bool_ )
+    for layout, ( rows, cells ) in groups.items():
+      index = np.ix_( layout, rows )
+      values[index] = self.convert( layout, cells ).T
+      present[index] = True
+    for column in range( len(self.header) ):
+      with open( self.file( column, 'values' ), 'ab' ) as file:
+        values[column].tofile( file )
+      with open( self.file( column, 'present' ), 'ab' ) as file:
+        np.packbits( present[column] ).tofile( file )
+    with open( os.path.join( self.directory, 'lineno.i8' ), 'ab' ) as file:
+      np.array( self._linenos, np.int64 ).tofile( file )
+    self.rows += count
+    self._linenos, self._buffer = [], []
+
+    # rows x columns float64 array of rows of values, int and float values convert directly
+  def convert( self, layout, cells ):
+    for column, value in zip( layout, cells[0] ):
+      if self.header[column]['enum'] is None and isinstance( value, enum.Enum ):
+        self.header[column]['enum'] = path_of_class( type(value) )
+    try:
+      return np.array( cells, np.float64 )
+    except ( TypeError, ValueError ):
+      return np.array( [ [ convert( value ) for value in row ] for row in cells ], np.float64 )
+
+  def close( self ):
+    self.flush()
+    with open( os.path.join( self.directory, 'header.json' ), 'w' ) as file:
+      json.dump( { 'version' : 1, 'rows' : self.rows, 'columns' : self.header }, file, indent = 1 )
+
+def path_of_class( cls ):
+  return '%s:%s' % ( cls.__module__, cls.__qualname__ )
+
+  # Writes ( line number, symtable ) blocks to 'directory', returns the number of rows
+def write( blocks, directory, block = 4096 ):
+  with Writer( directory, block ) as writer:
+    for lineno, symtable in blocks:
+      writer.append( lineno, symtable )
+  return writer.rows
+
+  # Read access to a result directory, the arrays are memory-mapped
+class Table:
+  def __init__( self, directory ):
+    self.directory = directory
+    with open( os.path.join( directory, 'header.json' ) ) as file:
+      header = json.load( file )
+    self.rows = header['rows']
+    self.header = { column['key'] : column for column in header['columns'] }
+    self.lineno = self.map( 'lineno.i8', np.int64 )
+
+  def map( self, name, dtype ):
+    count = self.rows if dtype != np.uint8 else ( self.rows + 7 ) // 8
+    if count == 0:
+      return np.zeros( 0, dtype )
+    return np.memmap( os.path.join( self.directory, name ), dtype, 'r', shape = ( count, ) )
+
+  def keys( self ):
+    return list( self.header )
+
+  def column( self, key ):
+    return self.header[ key if isinstance( key, str ) else path( key ) ]
+
+    # float64 values of a column, 0 where the key is absent
+  def values( self, key ):
+    return self.map( self.column( key )['values'], np.float64 )
+
+    # bool array, True where the key is present
+  def present( self, key ):
+    return np.unpackbits( self.map( self.column( key )['present'], np.uint8 ), count = self.rows ).astype( np.bool_ )
+
+    # symtable of one row, with keys and enum values resolved
+  def row( self, index ):
+    result = {}
+    for key_path, column in self.header.items():
+      bits = self.map( column['present'], np.uint8 )
+      if bits[index // 8] & ( 0x80 >> ( index % 8 ) ):
+        value = self.map( column['values'], np.float64 )[index]
+        if column['enum'] is not None:
+          value = resolve( column['enum'], 'enum' )( int( value ) )
+        result[ resolve( key_path, column['kind'] ) ] = value
+    return result
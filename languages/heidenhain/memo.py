@@ -0,0 +1,141 @@
+import collections
+
+import babel
+import babel.compiler as c
+import languages.heidenhain.parser as hh
+import languages.expression.commands as expression
+from babel.terminal import FAIL
+from babel.terminal import attempting
+from babel.state import Recorder
+
+__all__ = [ 'ParseCache' ]
+
+  # Line-level cache around the heidenhain parser, called like hh.Parse( state )
+  # CAM programs repeat the same block bodies with only the line number changing.
+  # A line is parsed once with a compiler.Recording parser into its effects - the
+  # deferred functions the parse executes - and the effects of the body, after the
+  # 'lineno' prefix, are stored by the text of the body. Later lines with the same body
+  # execute the effects of their own line number and the stored ones, without parsing.
+  # Lines are not cached, but parsed as usual, when:
+  #   - their body has not been seen before - recording and storing a line costs more than
+  #     parsing it, so unique lines would only slow the parse down. The cache remembers
+  #     the 'size' most recent such bodies and stores a body the second time it is seen.
+  #   - they fail to parse, or parse partially
+  #   - their effects read variables, through the expression GET command or a
+  #     compiled expression (languages.expression.compiled) that 'reads' them
+  # A hit replays the effects instead of parsing, which saves little per line, so the cache
+  # only pays off for input that repeats the same bodies many times. On mixed input it
+  # is about as fast as the parser alone ( see bench_cache ).
+  # The cache keeps the 'size' most recently used bodies. 'hits', 'misses' and 'bypassed'
+  # count the lines replayed from the cache, parsed and stored, and parsed but not stored.
+class ParseCache:
+  def __init__( self, size = 4096, parser = None ):
+    self.size     = size
+    self.parser   = hh.Parse if parser is None else parser
+    self.hits     = 0
+    self.misses   = 0
+    self.bypassed = 0
+    self._entries   = collections.OrderedDict()  # body -> ( effects, result )
+    self._seen      = collections.OrderedDict()  # bodies seen once -> None
+    self._recording = hh.build( c.Recording )
+    self._lineno    = attempting( hh.terminals['lineno'] )
+
+  def __len__( self ):
+    return len(self._entries)
+
+  def clear( self ):
+    self._entries.clear()
+    self._seen.clear()
+
+  def __call__( self, state ):
+    buffer = state.buffer
+    end = min( state.end, len(buffer) )
+    recorder = Recorder( buffer, state.pos, end )
+    prefix = self._lineno( recorder )
+    if prefix is FAIL:
+      prefix = ()
+      recorder = Recorder( buffer, state.pos, end )
+    body = buffer[recorder.pos:end]
+
+    entries = self._entries
+    try:
+      effects, result = entries[body]
+    except KeyError:
+      pass
+    else:
+      entries.move_to_end( body )
+      if self.replay( state, prefix + effects ):
+        self.hits += 1
+        return result
+      return self.parse( state )
+
+      # the first time a body is seen it is only remembered
+    seen = self._seen
+    if seen.pop( body, True ):
+      seen[body] = None
+      if len(seen) > self.size:
+        seen.popitem( last = False )
+      return self.parse( state )
+
+    recorder = Recorder( buffer, state.pos, end )
+    try:
+      result = self._recording( recorder )
+    except ( RuntimeError, babel.ParserFailedException ):
+      return self.parse( state )
+    effects = tuple( recorder.effects )
+    if recorder.remaining > 0 or not self.replay( state, effects ):
+      return self.parse( state )
+
+    if any( effect is expression.GET or getattr( effect, 'reads', None ) for effect in effects ) or not self.starts( effects, prefix ):
+      self.bypassed += 1
+      return result
+    self.misses += 1
+    entries[body] = ( effects[len(prefix):], result )
+    if len(entries) > self.size:
+      entries.popitem( last = False )
+    return result
+
+    # do the effects of the line begin with those of its line number
+  def starts( self, effects, prefix ):
+    return len(effects) >= len(prefix) and all( type(a) is type(b) and repr(a) == repr(b)
+                                                  for a, b in zip( effects, prefix ) )
+
+    # executes the effects on the state and consumes the line
+    # returns False, with the state unchanged, if an effect fails
+  def replay( self, state, effects ):
+    saved = state.save()
+    try:
+      for f in effects:
+        f( state )
+    except ( RuntimeError, babel.ParserFailedException ):
+      state.load( saved )
+      return False
+    state.advance( state.end )
+    return True
+
+  def parse( self, state ):
+    self.bypassed += 1
+    return self.parser( state )
+
+  # Times iter_parse over 'lines' with and without a ParseCache, alternating over 'n' runs,
+  # and checks the results agree
+def bench_cache( lines, size = 4096, n = 5 ):
+  import time
+  import statistics
+  import languages.heidenhain.program as program
+  ignore = lambda lineno, line, error: None
+  times = { 'parse' : [], 'cached' : [] }
+  for run in range(n):
+    for name in ( ( 'parse', 'cached' ) if run % 2 == 0 else ( 'cached', 'parse' ) ):
+      parser = ParseCache( size ) if name == 'cached' else hh.Parse
+      start = time.process_time()
+      results = [ ( lineno, repr( symtable ) ) for lineno, symtable in program.iter_parse( lines, parser, errors = ignore ) ]
+      times[name].append( time.process_time() - start )
+      if name == 'parse':
+        plain = results
+      else:
+        cached, cache = results, parser
+  print( 'parse: best %.2fs median %.2fs, cached: best %.2fs median %.2fs, identical: %s' %
+    ( min( times['parse'] ), statistics.median( times['parse'] ),
+      min( times['cached'] ), statistics.median( times['cached'] ), plain == cached ) )
+  print( 'hits %d, misses %d, bypassed %d' % ( cache.hits, cache.misses, cache.bypassed ) )
@@ -4,6 +4,8 @@ from babel.terminal import *
 from babel import State
 import babel.rule       as r
 import babel.compiler   as c
+import babel.generator  as g
+from babel.lexer import Lexer
 
 import languages.heidenhain.commands as cmd
 import languages.heidenhain.state    as s
@@ -13,11 +15,14 @@ from languages.heidenhain.state import Motion
 from languages.heidenhain.state import Spindle
 
 import languages.expression.parser    as expr
-import babel.lang.parser as p
+import babel.cache      as cache
+import os
 
-with open( 'languages/heidenhain/heidenhain.lang' ) as file:
-  lang = p.parseStr( file.read() )
-  globals().update( lang.symtable )
+  # Version of the terminal table below, part of the grammar cache key
+VERSION = 1
+
+symtable = cache.load( os.path.join( os.path.dirname( __file__ ), 'heidenhain.lang' ), VERSION )
+globals().update( symtable )
 
 p = re.compile
 
@@ -156,7 +161,43 @@ terminals = {
 
 # terminals = pushTerminals( terminals )
 
-Parse = heidenhain.compile( c.Reordering( terminals ) )
+  # Compiles the heidenhain grammar, and the expression grammar used by its terminals,
+  # with compiler class 'Compiler' (c.Sentinel, c.Lookahead, c.Reordering, c.Memoizing, ...)
+  # 'compiled' lowers each expression to one cached command (see languages.expression.compiled)
+  # 'grammar' is the rule compiled, the 'heidenhain' rule of heidenhain.lang by default
+  # 'lexed' matches the terminals through the tokens of a babel.lexer.Lexer, see lexer()
+def build( Compiler = c.Sentinel, compiled = True, grammar = None, lexed = False ):
+  expression_terminals, table = expr.terminals, terminals
+  if lexed:
+    tokens = lexer()
+    expression_terminals, table = tokens.table( expr.terminals ), tokens.table( terminals )
+  expression, primary = expr.build( Compiler( expression_terminals ), compiled )
+  table = dict( table, expression = expression, primary = primary )
+  return ( heidenhain if grammar is None else grammar ).compile( Compiler( table ) )
+
+  # Terminals whose patterns make the tokens, in the order they are tried at each position
+  # Keywords come before the addresses they start with ('C ' before the C axis, 'FN 0:' before F),
+  # addresses before the identifiers of expressions, which would take their letters.
+  # Patterns that cannot start with the same character can be in any order, the frequent
+  # ones - numbers and coordinates - come first, as every token tries the patterns in order.
+lexicon = ( 'lineno', 'LC', 'LPCP', 'CC', 'comment', 'begin_pgm', 'end_pgm', 'blockFormStart', 'blockFormEnd',
+            'XYZABC', 'PAPRL', 'CCXYZ', 'tool_axis', 'fn_f', 'F', 'MAX', 'compensation', 'direction',
+            'tool_options', 'auxilary', 'tool_call' )
+
+  # Lexer of the heidenhain language, the patterns of 'lexicon' and of the expression parser
+def lexer():
+  return Lexer( [ terminals[name] for name in lexicon ] + [ expr.terminals['climb_primary'] ] )
+
+Parse = build()
+
+  # Generates Python modules for the heidenhain grammar and the expression grammar with babel.generator
+  # The parser behaves as build( c.Sentinel, compiled ), 'directory' caches the modules (see generator.load)
+  # 'grammar' is the rule generated, the 'heidenhain' rule of heidenhain.lang by default
+def build_generated( directory = None, compiled = True, grammar = None ):
+  entries = expr.compiled_entries if compiled else expr.entries
+  expression, primary = ( g.load( rule, expr.terminals, directory ) for rule in entries )
+  table = dict( terminals, expression = expression, primary = primary )
+  return g.load( heidenhain if grammar is None else grammar, table, directory )
 
       
 def bench( n = 1000 ):
@@ -170,4 +211,219 @@ def bench( n = 1000 ):
   print( time.time() - start )
   print(q.symtable)
   print(r)
-  
\ No newline at end of file
+
+  # Times the closure compilers and the generated module on 'lines', 'n' runs each, alternating
+  # between them so that all see the same load, and prints the best and the median time per line
+  # 'lines' are by default the sample, a program of 'count' lines from bench.programs and the failing lines
+def bench_generated( n = 15, lines = None, count = 2000 ):
+  import time
+  from babel.state import Journal
+  if lines is None:
+    import bench.programs as programs
+    lines = sample + list( programs.generate( count ) ) + failing
+  parsers = [ ( Compiler.__name__, build( Compiler ) ) for Compiler in ( c.Reordering, c.Lookahead, c.Sentinel ) ]
+  parsers.append( ( 'generated', build_generated() ) )
+  timings = { name : [] for name, parser in parsers }
+  for i in range(n):
+    for name, parser in ( parsers if i % 2 == 0 else parsers[::-1] ):
+      start = time.process_time()
+      for line in lines:
+        state = Journal( line )
+        state.symtable.update( { 'Q1' : 1.0, 'Q2' : 2.0 } )
+        try:
+          parser( state )
+        except ( RuntimeError, ParserFailedException ):
+          pass
+      timings[name].append( ( time.process_time() - start ) * 1e6 / len(lines) )
+  for name, runs in timings.items():
+    runs.sort()
+    print( '%s: best %.2f us/line, median %.2f us/line' % ( name, runs[0], runs[len(runs)//2] ) )
+
+  # Cumulative import time of this module in fresh interpreters, as reported by -X importtime
+  # 'cold' removes the grammar caches before each run, so the grammars are parsed again
+def bench_import( runs = 5, cold = False ):
+  import subprocess
+  import shutil
+  import sys
+  root = os.path.dirname( os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) ) )
+  caches = [ os.path.join( os.path.dirname( module.__file__ ), cache.directory ) for module in ( expr, sys.modules[__name__] ) ]
+  env = dict( os.environ, PYTHONPATH = root )
+  times = []
+  for i in range(runs):
+    if cold:
+      for folder in caches:
+        shutil.rmtree( folder, ignore_errors = True )
+    result = subprocess.run( [ sys.executable, '-X', 'importtime', '-c', 'import ' + __name__ ],
+      cwd = root, env = env, stderr = subprocess.PIPE, stdout = subprocess.DEVNULL, universal_newlines = True )
+    for line in result.stderr.splitlines():
+      fields = line.split( '|' )
+      if len(fields) == 3 and fields[2].strip() == __name__:
+        times.append( int( fields[1] ) / 1000 )
+  print( '%s import: %.1f ms (min %.1f ms) over %d runs' % ( 'cold' if cold else 'warm', sum(times) / len(times), min(times), len(times) ) )
+
+  # Compiler that counts the invocations and failures of the terminals it was given
+def counting( Compiler ):
+  class Counting( Compiler ):
+    calls = 0
+    failures = 0
+    def __init__( self, terminals, *args ):
+      super().__init__( { key : self.count( value ) for key,value in terminals.items() }, *args )
+
+    def count( self, terminal ):
+      def _count( state ):
+        Counting.calls += 1
+        try:
+          return terminal( state )
+        except ParserFailedException:
+          Counting.failures += 1
+          raise
+      attempt = attempting( terminal )
+      def _attempt( state ):
+        Counting.calls += 1
+        result = attempt( state )
+        if result is FAIL:
+          Counting.failures += 1
+        return result
+      _count.attempt = _attempt
+      _count.pure = getattr( terminal, 'pure', False )
+      _count.first = getattr( terminal, 'first', None )
+      return _count
+  return Counting
+
+  # Sample lines covering the line types of the grammar, used by the benchmarks
+sample = [
+  'L X+50 Y-30 Z+150 R0 FMAX',
+  'L IX+0.5 FMAX',
+  'X+10 Y+5 R0 F200',
+  'LP PR+30 PA+20 DR- RL F500 M3',
+  'CC X+25 Y+25',
+  'TOOL CALL 5 Z S3000',
+  'FN 0: Q5 = Q1*2+Q2',
+  'M8 M3'
+]
+
+  # Lines that fail, or leave part of the line unparsed, added to the corpus of bench_optimizer
+failing = [ 'BOGUS LINE', 'L Z(-Q4)', 'L X+', 'FN 0: Q5 =', 'TOOL CALL', 'CC', 'L X+10 Y+5 R0 F', '7 L X+Q9 FMAX' ]
+
+  # Compares terminal invocations, failed terminal invocations and time per line of the compilers
+def bench_compilers( n = 1000, lines = sample, compilers = ( c.Reordering, c.Memoizing, c.Lookahead, c.Sentinel ) ):
+  import time
+  for Compiler in compilers:
+    Counting = counting( Compiler )
+    parser = build( Counting )
+    start = time.time()
+    for i in range(n):
+      for line in lines:
+        state = State( line )
+        state.symtable.update( { 'Q1' : 1.0, 'Q2' : 2.0 } )
+        parser( state )
+    elapsed = time.time() - start
+    total = n * len(lines)
+    print( '%s: %.2f terminal calls/line, %.2f failed/line, %.2f us/line' % 
+      ( Compiler.__name__, Counting.calls / total, Counting.failures / total, elapsed * 1e6 / total ) )
+
+  # Prints the rules and terminals of both grammars by time, and the heidenhain rule tree,
+  # profiled with compiler.Profiler over 'n' runs of 'lines'
+def bench_profile( n = 100, lines = sample, tree = False ):
+  expression_profiler = c.Profiler( expr.terminals )
+  expression, primary = expr.build( expression_profiler, True )
+  profiler = c.Profiler( dict( terminals, expression = expression, primary = primary ) )
+  parser = heidenhain.compile( profiler )
+  for i in range(n):
+    for line in lines:
+      state = State( line )
+      state.symtable.update( { 'Q1' : 1.0, 'Q2' : 2.0 } )
+      parser( state )
+  print( profiler.table() )
+  print( expression_profiler.table() )
+  if tree:
+    print( profiler.report( heidenhain ) )
+
+  # Counts the regex calls (match, search, ... of compiled patterns) made per line
+def bench_regex( parser = Parse, lines = sample ):
+  print( '%.2f regex calls/line' % regex_calls( parser, lines ) )
+
+def regex_calls( parser, lines, Compiler = c.Sentinel ):
+  import sys
+  calls = 0
+  def profile( frame, event, arg ):
+    nonlocal calls
+    if event == 'c_call' and isinstance( getattr( arg, '__self__', None ), type(p('')) ):
+      calls += 1
+  sys.setprofile( profile )
+  try:
+    outcomes( parser, lines, Compiler )
+  finally:
+    sys.setprofile( None )
+  return calls / len(lines)
+
+  # Parses each line on a new state with the variables of the benchmarks, returns for each line the
+  # remaining length, symtable and stack as text, or the error. States are journals, or recorders
+  # for compiler.Recording, whose effects are executed on a Cursor afterwards
+def outcomes( parser, lines, Compiler = c.Sentinel ):
+  from babel.state import Cursor
+  from babel.state import Journal
+  from babel.state import Recorder
+  result = []
+  for line in lines:
+    state = ( Recorder if Compiler is c.Recording else Journal )( line )
+    state.symtable.update( { 'Q1' : 1.0, 'Q2' : 2.0 } )
+    try:
+      parser( state )
+      if Compiler is c.Recording:
+        effects, state = state.effects, Cursor( line )
+        state.symtable.update( { 'Q1' : 1.0, 'Q2' : 2.0 } )
+        for f in effects:
+          f( state )
+      result.append( ( state.remaining, repr( state.symtable ), repr( state.stack ) ) )
+    except ( RuntimeError, ParserFailedException ) as error:
+      result.append( repr( error ) )
+  return result
+
+  # Parses 'lines' with the rules of heidenhain.lang as read and as rewritten by babel.optimizer,
+  # with each compiler and with the module of babel.generator, checks that both give the same
+  # outcomes and prints the time per line of both
+  # 'lines' are by default the sample, a program of 'count' lines from bench.programs and the failing
+  # lines. 'expressions' random expressions check the rules of expression.lang the same way
+  # ( see languages.expression.parser.bench_optimizer ), none with 0
+def bench_optimizer( lines = None, n = 3, count = 2000, expressions = 20000,
+                     compilers = ( c.Reordering, c.Memoizing, c.Lookahead, c.Sentinel, c.Recording ) ):
+  import time
+  if lines is None:
+    import bench.programs as programs
+    lines = sample + list( programs.generate( count ) ) + failing
+  plain = cache.load( os.path.join( os.path.dirname( __file__ ), 'heidenhain.lang' ), VERSION, optimize = False )
+  backends = [ ( Compiler.__name__, Compiler, lambda grammar, Compiler = Compiler: build( Compiler, grammar = grammar ) ) for Compiler in compilers ]
+  backends.append( ( 'generated', c.Sentinel, lambda grammar: build_generated( grammar = grammar ) ) )
+  for name, Compiler, make in backends:
+    timings = []
+    for grammar in ( plain['heidenhain'], heidenhain ):
+      parser = make( grammar )
+      start = time.time()
+      for i in range(n):
+        outcome = outcomes( parser, lines, Compiler )
+      timings.append( ( time.time() - start ) * 1e6 / ( n * len(lines) ) )
+      timings.append( outcome )
+    print( '%s: %.2f us/line, optimized %.2f us/line, identical: %s' % ( name, timings[0], timings[2], timings[1] == timings[3] ) )
+  print( '%d lines, %d failed' % ( len(lines), sum( isinstance( outcome, str ) for outcome in timings[1] ) ) )
+  if expressions > 0:
+    expr.bench_optimizer( expressions )
+
+  # Regex calls, tokens and time per line with and without the lexer stage, with the compiler
+  # 'Compiler', and whether both give the same outcomes
+  # A lexed line makes one regex call that scans its tokens, each token is one match of the master pattern
+def bench_lexer( lines = sample, n = 100, Compiler = c.Sentinel ):
+  import time
+  results = []
+  for lexed in ( False, True ):
+    parser = build( Compiler, lexed = lexed )
+    calls = regex_calls( parser, lines, Compiler )
+    start = time.time()
+    for i in range(n):
+      outcome = outcomes( parser, lines, Compiler )
+    print( '%s: %.2f regex calls/line, %.2f us/line' % ( 'lexed' if lexed else 'plain', calls, ( time.time() - start ) * 1e6 / ( n * len(lines) ) ) )
+    results.append( outcome )
+  tokens = lexer()
+  for line in lines:
+    tokens.tokens( line, 0, len(line) )
+  print( '%.2f tokens/line, identical: %s' % ( tokens.count / len(lines), results[0] == results[1] ) )
@@ -0,0 +1,131 @@
+import collections
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+
+import babel
+import babel.compiler as c
+import languages.heidenhain.parser as hh
+from babel.state import Cursor
+from babel.state import Journal
+from babel.state import Recorder
+from babel.source import mapped_lines
+
+__all__ = [ 'iter_parse', 'iter_parse_file', 'iter_parse_spans', 'iter_parse_parallel' ]
+
+  # Parses an NC program one line at a time
+  # Yields ( line number, symtable ) for every parsed line, line numbers start at 'start'.
+  # 'lines' is any iterable of lines - an open file is read lazily, so memory use does not
+  # depend on the length of the program. The symtable carried from line to line
+  # (Q parameters, modal values) is the only state kept between lines.
+  # A line that fails to parse, or parses partially, is passed to errors( lineno, line, exception )
+  # and skipped; without 'errors' the exception is raised.
+def iter_parse( lines, parser = hh.Parse, symtable = None, start = 1, errors = None ):
+  spans = ( ( line, 0, len( line.rstrip('\n') ) ) for line in lines )
+  return iter_parse_spans( spans, parser, symtable, start, errors )
+
+  # iter_parse for a program file, memory-mapped and parsed in place (see babel.source)
+def iter_parse_file( path, parser = hh.Parse, symtable = None, start = 1, errors = None, encoding = 'latin-1' ):
+  return iter_parse_spans( mapped_lines( path, encoding = encoding ), parser, symtable, start, errors )
+
+  # iter_parse for lines given as ( buffer, start, end ) spans of larger buffers
+def iter_parse_spans( spans, parser = hh.Parse, symtable = None, start = 1, errors = None ):
+  carried = {} if symtable is None else symtable
+  for lineno, ( buffer, begin, end ) in enumerate( spans, start ):
+    state = Journal( buffer, begin, end )
+    state.symtable.update( carried )
+    try:
+      parser( state )
+      if state.remaining > 0:
+        raise RuntimeError( 'Parser failed at line ' + buffer[begin:end] + ' rest: "' + state.input + '"' )
+    except ( RuntimeError, babel.ParserFailedException ) as error:
+      if errors is None:
+        raise
+      errors( lineno, buffer[begin:end], error )
+      continue
+    state.commit()
+    carried.update( state.symtable )
+    yield lineno, state.symtable
+
+  # Phase one of iter_parse_parallel, run in the worker processes
+  # Parses lines without a symtable and returns, for each line, the tuple of
+  # effects to execute on it, or None if the line has to be parsed serially
+def record( lines ):
+  global _recording
+  if _recording is None:
+    _recording = hh.build( c.Recording )
+  records = []
+  for line in lines:
+    state = Recorder( line.rstrip('\n') )
+    try:
+      _recording( state )
+    except ( RuntimeError, babel.ParserFailedException ):
+      records.append( None )
+      continue
+    records.append( tuple( state.effects ) if state.remaining == 0 else None )
+  return records
+
+_recording = None
+
+  # Parses an NC program like iter_parse, with the parsing spread over 'workers' processes
+  # Phase one parses chunks of 'chunksize' lines in parallel into effects - the deferred functions
+  # each line executes (see compiler.Recording). Phase two executes the effects line by line on the
+  # carried symtable. Lines that fail in either phase are parsed again serially, so the results,
+  # errors included, are those of iter_parse.
+  # At most 2 * workers chunks are in flight, memory use does not depend on the length of the program.
+  # With workers <= 1 both phases run in this process.
+def iter_parse_parallel( lines, workers = 4, chunksize = 1000, symtable = None, start = 1, errors = None ):
+  carried = {} if symtable is None else symtable
+  lines = iter( lines )
+  chunks = iter( lambda: list( itertools.islice( lines, chunksize ) ), [] )
+  lineno = start
+  if workers <= 1:
+    for chunk in chunks:
+      yield from replay( chunk, record( chunk ), carried, lineno, errors )
+      lineno += len(chunk)
+    return
+
+  with ProcessPoolExecutor( max_workers = workers ) as executor:
+    pending = collections.deque()
+    for chunk in itertools.islice( chunks, 2 * workers ):
+      pending.append( ( chunk, executor.submit( record, chunk ) ) )
+    while len(pending) > 0:
+      chunk, future = pending.popleft()
+      for chunk_ in itertools.islice( chunks, 1 ):
+        pending.append( ( chunk_, executor.submit( record, chunk_ ) ) )
+      yield from replay( chunk, future.result(), carried, lineno, errors )
+      lineno += len(chunk)
+
+  # Phase two of iter_parse_parallel
+def replay( chunk, records, carried, start, errors ):
+  for lineno, line, effects in zip( itertools.count( start ), chunk, records ):
+    if effects is not None:
+        # effects are executed without backtracking, a Cursor needs no trail
+      state = Cursor( line.rstrip('\n') )
+      state.symtable.update( carried )
+      try:
+        for f in effects:
+          f( state )
+      except ( RuntimeError, babel.ParserFailedException ):
+        effects = None
+    if effects is None:
+      yield from iter_parse( ( line, ), symtable = carried, start = lineno, errors = errors )
+      continue
+    carried.update( state.symtable )
+    yield lineno, state.symtable
+
+  # Lines per second of iter_parse and of iter_parse_parallel with each number of workers
+  # The results of the parallel runs are compared with the serial one
+def bench_parallel( path, workers = ( 1, 2, 4, 8 ), chunksize = 1000 ):
+  import time
+  ignore = lambda lineno, line, error: None
+  start = time.time()
+  with open( path ) as file:
+    serial = [ ( lineno, repr( symtable ) ) for lineno, symtable in iter_parse( file, errors = ignore ) ]
+  elapsed = time.time() - start
+  print( 'serial: %.2fs, %d lines/s' % ( elapsed, len(serial) / elapsed ) )
+  for count in workers:
+    start = time.time()
+    with open( path ) as file:
+      parallel = [ ( lineno, repr( symtable ) ) for lineno, symtable in iter_parse_parallel( file, count, chunksize, errors = ignore ) ]
+    elapsed = time.time() - start
+    print( '%d workers: %.2fs, %d lines/s, identical: %s' % ( count, elapsed, len(parallel) / elapsed, parallel == serial ) )
@@ -0,0 +1,324 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import babel
+import languages.heidenhain.parser as hh
+from languages.heidenhain.program import iter_parse
+
+__all__ = [ 'Service', 'Metrics', 'request' ]
+
+  # Long-running parse service, for clients that would otherwise start a Python process
+  # - and compile heidenhain.lang and expression.lang - for every program
+  # Programs are parsed by a pool of 'workers' processes, warmed up when the service starts.
+  # The service listens on a localhost TCP port ( 'host:port' ) or a Unix socket ( 'unix:path' ),
+  # one request per connection, in latin-1 lines:
+  #   PARSE [start]  then the lines of the program, up to the end of the client's writing side
+  #                  The program is parsed in chunks of 'chunksize' lines as it arrives, each
+  #                  chunk in a worker, with the symtable carried from chunk to chunk, and the
+  #                  replies are streamed back chunk by chunk, one line per line of the program:
+  #                    '<lineno>\t<symtable>' for a parsed block, as written by parse.py
+  #                    '<lineno>\t!<error>'   for a line that failed, as reported by parse.py
+  #                  then 'END <blocks> <errors>'. Line numbers start at 'start', 1 by default.
+  #                  An error that stops the program - an exception that iter_parse raises, as
+  #                  for a division by zero, or a worker that died - is replied 'ERROR <message>'
+  #                  before 'END', the rest of the program is not parsed. A pool whose worker
+  #                  died is replaced. Its workers are forked from a forkserver started with the
+  #                  first pool, so they do not hold the connections open in the service.
+  #   STATS          replies the metrics as one line of JSON
+  # At most 'limit' programs are parsed at once, the others wait in turn. A program that
+  # finds 'backlog' programs waiting is replied 'BUSY' and closed.
+class Service:
+  def __init__( self, workers = 4, limit = None, backlog = 64, chunksize = 100 ):
+    self.workers   = workers
+    self.limit     = 2 * workers if limit is None else limit
+    self.backlog   = backlog
+    self.chunksize = chunksize
+    self.metrics   = Metrics()
+    self._executor = None
+    self._slots    = None
+    self._server   = None
+
+    # Starts the worker pool and listens on 'address'
+  async def start( self, address ):
+    loop = asyncio.get_event_loop()
+    self._executor = self.pool()
+    self._slots = asyncio.Semaphore( self.limit )
+    await asyncio.gather( *( loop.run_in_executor( self._executor, warm ) for i in range( self.workers ) ) )
+    if address.startswith( 'unix:' ):
+      self._server = await asyncio.start_unix_server( self.handle, address[len('unix:'):] )
+    else:
+      host, port = split( address )
+      self._server = await asyncio.start_server( self.handle, host, port )
+    return self._server
+
+    # Worker pool, forked from the forkserver rather than from the service and its open connections
+  def pool( self ):
+    return ProcessPoolExecutor( max_workers = self.workers, mp_context = multiprocessing.get_context( 'forkserver' ) )
+
+  async def close( self ):
+    if self._server is not None:
+      self._server.close()
+      await self._server.wait_closed()
+    if self._executor is not None:
+      self._executor.shutdown()
+
+  async def handle( self, reader, writer ):
+    try:
+      header = ( await reader.readline() ).decode( 'latin-1' ).split()
+      if header[:1] == [ 'PARSE' ]:
+        await self.parse( reader, writer, int( header[1] ) if len(header) > 1 else 1 )
+      elif header[:1] == [ 'STATS' ]:
+        writer.write( ( json.dumps( self.metrics.snapshot() ) + '\n' ).encode( 'latin-1' ) )
+      else:
+        writer.write( b'ERROR unknown request\n' )
+      await writer.drain()
+    except ( ConnectionError, ValueError ):
+      self.metrics.dropped += 1
+    finally:
+      writer.close()
+
+  async def parse( self, reader, writer, start ):
+    metrics = self.metrics
+    if self._slots.locked() and metrics.queued >= self.backlog:
+      metrics.rejected += 1
+      writer.write( b'BUSY\n' )
+      return
+    arrived = time.perf_counter()
+    metrics.queued += 1
+    metrics.max_queued = max( metrics.max_queued, metrics.queued )
+    try:
+      await self._slots.acquire()
+    finally:
+      metrics.queued -= 1
+    metrics.active += 1
+    started = time.perf_counter()
+    lines = blocks = errors = 0
+    try:
+      loop = asyncio.get_event_loop()
+      carried, lineno = {}, start
+      while True:
+        chunk = await read( reader, self.chunksize )
+        if len(chunk) == 0:
+          break
+        try:
+          text, carried, parsed, failed, stopped = await loop.run_in_executor( self._executor, parse_chunk, chunk, carried, lineno )
+        except Exception as error:   # the worker died, or the chunk or its result could not be pickled
+          if isinstance( error, BrokenProcessPool ):
+            metrics.restarts += 1
+            self._executor.shutdown( wait = False )
+            self._executor = self.pool()
+          text, parsed, failed, stopped = 'ERROR %s\n' % describe( error ), 0, 0, True
+        writer.write( text.encode( 'latin-1', 'replace' ) )
+        await writer.drain()
+        lineno += len(chunk)
+        lines, blocks, errors = lines + len(chunk), blocks + parsed, errors + failed
+        if stopped:
+          metrics.failed += 1
+          break
+      writer.write( ( 'END %d %d\n' % ( blocks, errors ) ).encode( 'latin-1' ) )
+    finally:
+      self._slots.release()
+      metrics.active -= 1
+      metrics.served( started - arrived, time.perf_counter() - arrived, lines, blocks, errors )
+
+  # Counters of a Service, waits and latencies in seconds
+  # 'wait' is the time a program waited for its turn, 'latency' the time from its
+  # header to its last reply
+class Metrics:
+  def __init__( self ):
+    self.requests    = 0   # programs served
+    self.active      = 0   # programs being parsed
+    self.queued      = 0   # programs waiting for their turn
+    self.max_queued  = 0
+    self.rejected    = 0   # programs replied BUSY
+    self.dropped     = 0   # connections lost or malformed
+    self.failed      = 0   # programs replied ERROR
+    self.restarts    = 0   # worker pools replaced after a worker died
+    self.lines       = 0
+    self.blocks      = 0
+    self.errors      = 0
+    self.wait        = 0.0  # total
+    self.max_wait    = 0.0
+    self.latency     = 0.0  # total
+    self.max_latency = 0.0
+
+  def served( self, wait, latency, lines, blocks, errors ):
+    self.requests += 1
+    self.lines  += lines
+    self.blocks += blocks
+    self.errors += errors
+    self.wait    += wait
+    self.latency += latency
+    self.max_wait    = max( self.max_wait, wait )
+    self.max_latency = max( self.max_latency, latency )
+
+  def snapshot( self ):
+    result = dict( vars( self ) )
+    result['mean_wait']    = self.wait / self.requests if self.requests else 0.0
+    result['mean_latency'] = self.latency / self.requests if self.requests else 0.0
+    return result
+
+  # 'host:port' -> ( host, port )
+def split( address ):
+  host, port = address.rsplit( ':', 1 )
+  return host or '127.0.0.1', int( port )
+
+async def connect( address ):
+  if address.startswith( 'unix:' ):
+    return await asyncio.open_unix_connection( address[len('unix:'):] )
+  return await asyncio.open_connection( *split( address ) )
+
+  # The next lines of a program, at most 'count', none at its end
+async def read( reader, count ):
+  chunk = []
+  while len(chunk) < count:
+    line = await reader.readline()
+    if len(line) == 0:
+      break
+    chunk.append( line.decode( 'latin-1' ) )
+  return chunk
+
+  # Run in each worker when the service starts, so the first program finds it ready
+def warm():
+  list( iter_parse( [ 'L X+0 Y+0 R0 FMAX' ], hh.Parse ) )
+  return os.getpid()
+
+  # Parses the lines of a chunk, run in the workers
+  # Returns the reply lines, the carried symtable, the numbers of blocks and errors, and whether
+  # an exception stopped the program, replied 'ERROR <message>' after the lines parsed before it
+def parse_chunk( lines, carried, start ):
+  replies = []
+  errors = []
+  def report( lineno, line, error ):
+    errors.append( lineno )
+    message = 'Parser failed at line ' + line if isinstance( error, babel.ParserFailedException ) else str( error )
+    replies.append( '%d\t!%s\n' % ( lineno, message ) )
+  blocks = 0
+  try:
+    for lineno, symtable in iter_parse( lines, hh.Parse, carried, start, report ):
+      replies.append( '%d\t%r\n' % ( lineno, symtable ) )
+      blocks += 1
+  except Exception as error:
+    replies.append( 'ERROR %s\n' % describe( error ) )
+    return ''.join( replies ), carried, blocks, len(errors), True
+  return ''.join( replies ), carried, blocks, len(errors), False
+
+  # One line message of an exception that stopped a program
+def describe( error ):
+  return ' '.join( ( type(error).__name__ + ': ' + str( error ) ).split() )
+
+  # Sends a program to the service at 'address' and returns its replies, without the line ends
+  # The replies are read while the program is sent, as the service streams them back
+async def request( address, lines, start = 1 ):
+  reader, writer = await connect( address )
+  async def send():
+    writer.write( ( 'PARSE %d\n' % start ).encode( 'latin-1' ) )
+    for line in lines:
+      writer.write( ( line.rstrip('\n') + '\n' ).encode( 'latin-1' ) )
+      await writer.drain()
+    writer.write_eof()
+  sending = asyncio.ensure_future( send() )
+  replies = []
+  try:
+    while True:
+      line = await reader.readline()
+      if len(line) == 0:
+        break
+      replies.append( line.decode( 'latin-1' ).rstrip('\n') )
+    # a busy service, or one that stopped at an error, closes without reading the whole program
+    if replies[:1] != [ 'BUSY' ] and not any( reply.startswith( 'ERROR' ) for reply in replies ):
+      await sending
+  finally:
+    sending.cancel()
+    writer.close()
+  return replies
+
+async def stats( address ):
+  reader, writer = await connect( address )
+  try:
+    writer.write( b'STATS\n' )
+    return json.loads( ( await reader.readline() ).decode( 'latin-1' ) )
+  finally:
+    writer.close()
+
+  # usage: python -m languages.heidenhain.service [--address host:port|unix:path] [--workers N] ...
+def main( argv = None ):
+  parser = argparse.ArgumentParser( prog = 'python -m languages.heidenhain.service' )
+  parser.add_argument( '--address', default = '127.0.0.1:7474', help = 'host:port or unix:path' )
+  parser.add_argument( '--workers', type = int, default = os.cpu_count() or 1 )
+  parser.add_argument( '--limit', type = int, default = None, help = 'programs parsed at once, twice the workers by default' )
+  parser.add_argument( '--backlog', type = int, default = 64, help = 'programs waiting before BUSY' )
+  parser.add_argument( '--chunksize', type = int, default = 100, help = 'lines parsed per worker call' )
+  args = parser.parse_args( argv )
+
+  service = Service( args.workers, args.limit, args.backlog, args.chunksize )
+  loop = asyncio.get_event_loop()
+  loop.run_until_complete( service.start( args.address ) )
+  print( 'serving on ' + args.address, flush = True )
+  try:
+    loop.run_forever()
+  except KeyboardInterrupt:
+    pass
+  finally:
+    loop.run_until_complete( service.close() )
+  return 0
+
+  # Latency of a program of 'count' lines through the service against cold runs of parse.py
+  # The service runs in its own process on a Unix socket. 'clients' programs are sent at once,
+  # and the replies are checked against the output of parse.py
+def bench_service( count = 100, n = 10, workers = 4, clients = ( 1, 8 ) ):
+  import statistics
+  import subprocess
+  import tempfile
+  import bench.programs as programs
+  root = os.path.dirname( os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) ) )
+  environment = dict( os.environ, PYTHONPATH = root )
+  directory = tempfile.mkdtemp( prefix = 'service' )
+  source, output = os.path.join( directory, 'program.H' ), os.path.join( directory, 'program.txt' )
+  programs.write( source, count )
+  with open( source ) as file:
+    lines = file.readlines()
+
+  cold = []
+  for i in range( n ):
+    start = time.perf_counter()
+    subprocess.run( [ sys.executable, os.path.join( root, 'parse.py' ), source, output ], env = environment,
+                    stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL, check = True )
+    cold.append( time.perf_counter() - start )
+  print( 'cold parse.py: median %.1f ms, best %.1f ms' % ( statistics.median( cold ) * 1e3, min( cold ) * 1e3 ) )
+  with open( output ) as file:
+    expected = [ line.rstrip('\n') for line in file ]
+
+  address = 'unix:' + os.path.join( directory, 'service.sock' )
+  server = subprocess.Popen( [ sys.executable, '-m', 'languages.heidenhain.service', '--address', address, '--workers', str( workers ) ],
+                             env = environment, cwd = root, stdout = subprocess.PIPE, stderr = subprocess.DEVNULL, universal_newlines = True )
+  try:
+    server.stdout.readline()   # serving on ...
+    loop = asyncio.get_event_loop()
+    identical = True
+    for concurrent in clients:
+      latencies = []
+      async def timed():
+        start = time.perf_counter()
+        replies = await request( address, lines )
+        latencies.append( time.perf_counter() - start )
+        return replies
+      for i in range( n ):
+        for replies in loop.run_until_complete( asyncio.gather( *( timed() for j in range( concurrent ) ) ) ):
+          identical = identical and replies[:-1] == expected and replies[-1].startswith( 'END' )
+      print( 'service, %d clients: median %.1f ms, best %.1f ms' % ( concurrent, statistics.median( latencies ) * 1e3, min( latencies ) * 1e3 ) )
+    metrics = loop.run_until_complete( stats( address ) )
+    print( 'identical: %s, served %d, mean wait %.2f ms, max queued %d' % ( identical, metrics['requests'], metrics['mean_wait'] * 1e3, metrics['max_queued'] ) )
+  finally:
+    server.terminate()
+    server.wait()
+
+if __name__ == '__main__':
+  sys.exit( main() )
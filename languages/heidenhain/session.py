@@ -0,0 +1,171 @@
+import bisect
+
+import babel
+import languages.heidenhain.parser as hh
+import languages.heidenhain.state as machine
+from babel.state import Journal
+from hydra.classes import AttributeMeta
+
+__all__ = [ 'Session' ]
+
+  # Parsed and simulated NC program that follows edits of its lines
+  # Every line is parsed into its block - the symtable of the line - and the blocks are
+  # executed one after another on the machine state ( languages.heidenhain.state.Motion ).
+  # Only variables (Q parameters, registers) are carried from block to block, the Morph
+  # attributes of a block are those its own line sets, so the blocks can be simulated.
+  # The session keeps the block of every line and the machine state before every 'interval'-th
+  # line. After an edit, the lines are parsed from the edit on until an unchanged line parses
+  # to its previous block again, and simulated from the nearest state before the edit until
+  # the state before a kept line matches the previous run again.
+  # Lines that fail to parse or to simulate are passed to errors( lineno, line, exception ) and
+  # skipped; without 'errors' the exception is raised. Line indices start at 0, numbers at 1.
+class Session:
+  def __init__( self, lines = (), interval = 256, parser = hh.Parse, errors = None ):
+    self.interval = interval
+    self.parser   = parser
+    self.errors   = errors
+    self.lines    = []
+    self.blocks   = []     # block of each line, None if the line failed to parse
+    self._marks   = [ 0 ]  # sorted line indices of the kept states
+    self._states  = [ machine.default() ]  # machine state before the line of each mark
+    self.reparsed    = 0   # lines parsed by the last edit
+    self.resimulated = 0   # lines simulated by the last edit
+    self.edit( 0, 0, lines )
+
+  def __len__( self ):
+    return len(self.lines)
+
+    # machine state before the line at 'index', state( len(session) ) is the final one
+  def state( self, index ):
+    mark = bisect.bisect_right( self._marks, index ) - 1
+    motion = self._states[mark]
+    for i in range( self._marks[mark], index ):
+      motion = self.simulate( i, motion )
+    return motion
+
+  @property
+  def final( self ):
+    return self.state( len(self.lines) )
+
+    # Replaces lines[start:stop] with 'lines'
+  def edit( self, start, stop, lines ):
+    lines = [ line.rstrip('\n') for line in lines ]
+    start, stop, _ = slice( start, stop ).indices( len(self.lines) )
+    stop = max( start, stop )
+    delta = len(lines) - ( stop - start )
+    self.lines[start:stop] = lines
+    self.blocks[start:stop] = [ None ] * len(lines)
+      # states inside the replaced lines are dropped, those after it move with their lines
+    first = bisect.bisect_right( self._marks, start )
+    last  = max( first, bisect.bisect_left( self._marks, stop ) )
+    self._marks[first:]  = [ mark + delta for mark in self._marks[last:] ]
+    self._states[first:] = self._states[last:]
+    changed = self.reparse( start, start + len(lines) )
+    self.resimulate( start, changed )
+
+    # Parses lines from 'start' on, lines before 'stop' are new
+    # Returns the index of the line after the last block that changed
+  def reparse( self, start, stop ):
+    variables = self.variables( start )
+    changed = stop
+    i = start
+    while i < len(self.lines):
+      block = self.parse( i, variables )
+      if block is not None:
+        if i >= stop and block == self.blocks[i]:
+          break
+        variables = { key : value for key, value in block.items() if not isinstance( key, AttributeMeta ) }
+      if block is not None or self.blocks[i] is not None:
+        changed = i + 1
+      self.blocks[i] = block
+      i += 1
+    self.reparsed = i - start
+    return max( changed, stop )
+
+    # Variables carried into the line at 'index'
+  def variables( self, index ):
+    for block in reversed( self.blocks[:index] ):
+      if block is not None:
+        return { key : value for key, value in block.items() if not isinstance( key, AttributeMeta ) }
+    return {}
+
+  def parse( self, index, variables ):
+    line = self.lines[index]
+    state = Journal( line )
+    state.symtable.update( variables )
+    try:
+      self.parser( state )
+      if state.remaining > 0:
+        raise RuntimeError( 'Parser failed at line ' + line + ' rest: "' + state.input + '"' )
+    except ( RuntimeError, babel.ParserFailedException ) as error:
+      self.report( index, error )
+      return None
+    state.commit()
+    return state.symtable
+
+    # Simulates from the nearest state before 'start', replacing the kept states
+    # on the way, until a state from 'stop' on matches its previous value
+  def resimulate( self, start, stop ):
+    mark = bisect.bisect_right( self._marks, start ) - 1
+    index = self._marks[mark]
+    motion = self._states[mark]
+    mark += 1
+    begin = index
+    while index < len(self.lines):
+      motion = self.simulate( index, motion )
+      index += 1
+      if mark < len(self._marks) and self._marks[mark] == index:
+        if index >= stop and machine.snapshot( motion ) == machine.snapshot( self._states[mark] ):
+          break
+        self._states[mark] = motion
+        mark += 1
+      elif index - self._marks[mark - 1] >= self.interval:
+        self._marks.insert( mark, index )
+        self._states.insert( mark, motion )
+        mark += 1
+    self.resimulated = index - begin
+
+    # machine state after the line at 'index'
+  def simulate( self, index, motion ):
+    block = self.blocks[index]
+    if block is None:
+      return motion
+    try:
+      result = machine.step( motion, block )
+      if result is None:
+        raise RuntimeError( 'Simulation failed at line ' + self.lines[index] )
+      return result
+    except RuntimeError as error:
+      self.report( index, error )
+      return motion
+
+  def report( self, index, error ):
+    if self.errors is None:
+      raise error
+    self.errors( index + 1, self.lines[index], error )
+
+  # Times a full parse and simulation of the program at 'path' against the edit of one line
+  # in its middle, and checks the edited session against a new one of the edited program
+  # Without 'path', a numbered program of 'count' lines from bench.programs, 2000 by default
+def bench_session( path = None, interval = 256, count = None ):
+  import time
+  ignore = lambda lineno, line, error: None
+  if path is None:
+    import bench.programs as programs
+    lines = list( programs.generate( 2000 if count is None else count ) )
+  else:
+    with open( path ) as file:
+      lines = file.read().split('\n')[:count]
+  failed = []
+  start = time.time()
+  session = Session( lines, interval, errors = lambda lineno, line, error: failed.append( lineno ) )
+  print( 'full: %.2fs, %d lines, %d failed' % ( time.time() - start, len(lines), len(failed) ) )
+  middle = len(lines) // 2
+  for text in ( 'L IX+0.5 F200', 'FN 0: Q1 = 3', lines[middle] ):
+    start = time.time()
+    session.edit( middle, middle + 1, [ text ] )
+    print( 'edit "%s": %.3fs, reparsed %d, resimulated %d' % ( text, time.time() - start, session.reparsed, session.resimulated ) )
+  lines[middle] = text
+  fresh = Session( lines, interval, errors = ignore )
+  print( 'identical:', session.blocks == fresh.blocks and
+           machine.snapshot( session.final ) == machine.snapshot( fresh.final ) )
@@ -1,5 +1,5 @@
 from enum import Enum, IntEnum, unique
-from hydra import Morph, morphism, construct
+from hydra import Morph, AttributeMeta, morphism, construct, update, cached_schema
 import math
 
 @unique
@@ -240,4 +240,106 @@ def StateDict():
   return pool
 
 def default():
-  return construct(Motion, StateDict())
\ No newline at end of file
+  return construct(Motion, StateDict())
+
+# Machine state after executing a parsed block ( symtable ) on 'motion'
+# Incremental coordinates of the block are relative to 'motion', so they are reset first
+# Only the Morph attributes of the block are simulated: variables and registers ( the line
+# number is a Push, which hydra.morph would call as a morphism ) are not part of the state
+# Returns None if hydra.update finds no state
+# 'solver' is the solve function of hydra.update, hydra.solve by default
+def step( motion, block, solver=None ):
+  motion, decomposition = reset( motion )
+  block = { key : value for key, value in block.items() if isinstance( key, AttributeMeta ) }
+  return update( motion, block, decomposition, solver=solver )
+
+# Copy of 'motion' with the incremental coordinates reset, and its terminals before the reset
+def reset( motion ):
+  decomposition = cached_schema(type(motion)).items(motion)
+  for attr in decomposition:
+    if attr.name == 'inc':
+      decomposition[attr] = 0
+  return construct( type(motion), decomposition ), decomposition
+
+# Terminal values of a machine state, in the slot order of its schema ( see hydra.schema )
+# Two states are the same if their snapshots compare equal
+def snapshot( motion ):
+  return tuple( cached_schema(type(motion)).decompose(motion) )
+
+# Blocks of the lines that parse, as languages.heidenhain.session simulates them: only variables are carried,
+# and the blocks keep only their Morph attributes, as step simulates them ( no line number register )
+def parsed( lines ):
+  from languages.heidenhain.program import iter_parse
+  blocks, variables = [], {}
+  for line in lines:
+    for lineno, block in iter_parse( [ line ], symtable=dict(variables), errors=lambda *args: None ):
+      blocks.append( { key : value for key, value in block.items() if isinstance( key, AttributeMeta ) } )
+      variables = { key : value for key, value in block.items() if not isinstance( key, AttributeMeta ) }
+  return blocks
+
+# Checks with hydra.check_solve that hydra.solve_graph solves every block of a program as hydra.solve does,
+# then times the machine states of the program with both, 'n' times each, alternating between them
+# so that both see the same load. Prints the best and the median time of the runs
+def bench_solve( lines, n=5 ):
+  import time
+  from hydra import solve, solve_graph, check_solve
+  blocks = parsed( lines )
+  motion, failed = default(), 0
+  for block in blocks:
+    try:
+      motion = step( motion, block, check_solve )
+    except RuntimeError as error:
+      if str(error).startswith('solve_graph differs'):
+        raise
+      failed += 1
+  print( 'check_solve: %d blocks, %d failed, identical' % ( len(blocks), failed ) )
+  timings = { solve : [], solve_graph : [] }
+  for i in range( n ):
+    for solver in ( ( solve, solve_graph ) if i % 2 == 0 else ( solve_graph, solve ) ):
+      start = time.process_time()
+      motion = default()
+      for block in blocks:
+        try:
+          motion = step( motion, block, solver )
+        except RuntimeError:
+          pass
+      timings[solver].append( ( time.process_time() - start ) * 1e6 / len(blocks) )
+  for solver, runs in timings.items():
+    runs.sort()
+    print( '%s: best %.1f us/block, median %.1f us/block' % ( solver.__name__, runs[0], runs[len(runs)//2] ) )
+
+# Times the machine states of a program, 'n' times, with hydra.update and with hydra.update_retry,
+# counts the blocks hydra.update_dirty leaves to update_retry, and checks that both give the same states
+def bench_update( lines, n=1 ):
+  import time
+  from hydra import update_dirty, update_retry
+  blocks = parsed( lines )
+  fallbacks, different, motion = 0, 0, default()
+  for block in blocks:
+    previous, decomposition = reset( motion )
+    result = update_dirty( previous, dict(block), decomposition )
+    try:
+      previous, decomposition = reset( motion )
+      expected = update_retry( previous, dict(block), decomposition )
+    except RuntimeError:
+      # update raises as well, unless update_dirty solved the block
+      different += result is not None
+      continue
+    if result is None:
+      fallbacks += 1
+    elif not all( a == b or math.isclose( a, b, abs_tol=0.0001 ) for a, b in zip( snapshot(result), snapshot(expected) ) ):
+      different += 1
+    motion = expected
+  print( '%d blocks, %d left to update_retry, %d different' % ( len(blocks), fallbacks, different ) )
+  for updater in ( update_retry, update ):
+    start = time.time()
+    for i in range( n ):
+      motion, failed = default(), 0
+      for block in blocks:
+        previous, decomposition = reset( motion )
+        try:
+          motion = updater( previous, dict(block), decomposition )
+        except RuntimeError:
+          failed += 1
+    elapsed = time.time() - start
+    print( '%s: %.1f us/block, %d failed' % ( updater.__name__, elapsed * 1e6 / ( n * len(blocks) ), failed ) )
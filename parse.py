@@ -1,82 +1,62 @@
-# from concurrent.futures import ProcessPoolExecutor, as_completed
 import time
 import sys
 import babel
 import languages.heidenhain.parser as hh
-from babel.state import State
-import math
-import pickle
+from languages.heidenhain.program import iter_parse
+from languages.heidenhain.program import iter_parse_file
+from languages.heidenhain.program import iter_parse_parallel
 from os.path import basename, abspath, splitext
 
+  # prints the lines that failed to parse, parsing goes on with the next line
+def report( lineno, line, error ):
+  if isinstance( error, babel.ParserFailedException ):
+    print('Parser failed at line ' + line)
+  else:
+    print(str(error))
+
 def parse( program, lineOffset ):
-  results = []        #result list
-  
-  parser = hh.Parse
-  symtable = {}
-  for i, line in enumerate(program):
-      #append the line number marker, start at 1 and use the worker thread offset
-    # results.append(CNC.AST.LineNumber(i+lineOffset+1))
-    try:
-      state = State( line.rstrip('\n') )
-      state.symtable.update( symtable )
-      rest = parser( state )
-      if len(state.input) > 0:
-        raise RuntimeError( 'Parser failed at line ' + str(line) + ' rest: "' + state.input + '"' )
-      else:
-        results.append( state.symtable )
-        symtable.update( state.symtable )
-    except RuntimeError as err:
-      print(str(err))
-    except babel.ParserFailedException:
-      print('Parser failed at line ' + line)
-  return results
+  return [ symtable for lineno, symtable in iter_parse( program, hh.Parse, start = lineOffset + 1, errors = report ) ]
+
+  # Streams parsed blocks to 'output', one "lineno<TAB>symtable" line per block
+  # Returns the number of blocks written
+def write( blocks, output ):
+  count = 0
+  for lineno, symtable in blocks:
+    output.write( '%d\t%r\n' % ( lineno, symtable ) )
+    count += 1
+  return count
 
-  # split the lst into chunks of size sz
-def split( lst, sz ):
-  return [lst[i:i+sz] for i in range(0, len(lst), sz)]
-    
+  # usage: parse.py program [output] [workers]
+  # with more than one worker the program is parsed with iter_parse_parallel
+  # an output ending in '.cols' is written in the columnar format of languages.heidenhain.columns
 def main():
-  program = open( sys.argv[1], 'r');  
-  pgmList = list(program.__iter__())
-  program.close()
-  
-  workers = 4 # number of worker processes
-    #split the program into chunks for processing
-  n=math.ceil(len(pgmList)/workers)
-  Chunks = split(pgmList, n)
-  result = [ None for i in range(0,workers) ]
-  
+  fname = splitext(basename(sys.argv[1]))[0]+".txt"
+  if len(sys.argv) > 2:
+    fname = sys.argv[2]
+  workers = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+
   print('start')
   t = time.time()
-  '''with ProcessPoolExecutor(max_workers=workers) as executor:
-        # Start the load operations and mark each future with its index in the result
-      future_to_index = {executor.submit(parse, chunk, i*n): i for i, chunk in enumerate(Chunks)}
-      for future in as_completed(future_to_index):
-            #get the index of the future
-          index = future_to_index[future]
-          try:
-                # store the result in its place in the program
-              result[index] = future.result()
-          except Exception as exc:
-              print('Process generated an exception: %s' % (exc))
-          else:
-              print('Process ' + str(index) + ' finished')'''
-  parseOutput = parse( pgmList, 0 )
+  if workers > 1:
+    program = open( sys.argv[1], 'r', encoding = 'latin-1' )
+    blocks = iter_parse_parallel( program, workers, errors = report )
+  else:
+    program = None
+    blocks = iter_parse_file( sys.argv[1], hh.Parse, errors = report )
+  try:
+    if fname.endswith( '.cols' ):
+      import languages.heidenhain.columns as columns
+      count = columns.write( blocks, fname )
+    else:
+      with open( fname, 'w' ) as output:
+        count = write( blocks, output )
+  finally:
+    if program is not None:
+      program.close()
   elapsed = time.time() - t
   print( str(elapsed) + "s elapsed" )
-  
-    #collapse the list of lists into a list
-  # parseOutput = [ item for sublist in result for item in sublist ]
-    #output to file
-  
-  fname = splitext(basename(sys.argv[1]))[0]+".p"
-  
-  '''output  = open( fname, 'wb' )
-  pickle.dump( parseOutput, output )
-  output.close()'''
-  return parseOutput
-      
-  
+  print( str(count) + " blocks written to " + fname )
+  return count
 
-parseOutput = main()
-pgm = iter(parseOutput)
\ No newline at end of file
+if __name__ == '__main__':
+  main()
@@ -73,20 +73,3 @@ s3 = decompose_solve(s2, s.symtable)
 s = b.State('CC IX-20 IY+30')
 r = p.Parse(s)
 s3 = decompose_solve(s2, s.symtable)
-import time
-def do_loop( n ):
-  print('Test 6: looping')
-  start = time.time()
-  s4 = s3
-  att4 = None
-
-  for i in range(n):
-    s = b.State('LP IPA+20 PR30 FMAX')
-    r = p.Parse(s)
-    s4 = decompose_solve(s4, s.symtable)
-    if s2 is None:
-      print('failed ',i)
-      break
-  print( time.time() - start )
-
-do_loop(200000)